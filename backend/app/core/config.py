@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 from pydantic import Field
 import os
 
@@ -7,6 +7,16 @@ import os
 class Settings(BaseSettings):
     # 資料庫 - 必須從環境變數載入
     database_url: str = Field(..., description="Database connection URL")
+    # 唯讀副本（JSON 陣列），未設定時讀取也走主庫
+    database_replica_urls: List[str] = []
+    # 使用者寫入後多少秒內的讀取固定走主庫（讀己之寫）
+    read_your_writes_seconds: float = Field(5.0, ge=0)
+    # 副本連線失敗後暫停使用的秒數
+    replica_retry_seconds: float = Field(30.0, gt=0)
+    # 資料庫分片（JSON 物件，名稱 -> URL），工作區可指定分片以隔離大型租戶
+    database_shard_urls: Dict[str, str] = {}
+    # 此 worker 專責服務的分片（主庫為 "default"），未設定時服務所有工作區，其他分片的請求回傳 421
+    worker_shards: List[str] = []
     
     # JWT - 安全設定，secret_key 必須從環境變數載入
     secret_key: str = Field(..., min_length=32, description="JWT secret key (minimum 32 characters)")
@@ -27,6 +37,63 @@ class Settings(BaseSettings):
     # 時區設定
     timezone: str = "Asia/Taipei"
     
+    # 啟動 - 是否於啟動時建立尚未存在的資料表（尚無遷移流程，預設建立；設為 false 時改於部署時執行
+    # python -m app.jobs.create_tables）、
+    # 是否於背景預熱（連線池、bcrypt、熱路徑查詢編譯，完成前 /ready 回傳 503）與每個資料庫預先建立的連線數、
+    # 預熱失敗的重試間隔，以及由匯入到就緒的時間預算（超過時寫入警告）
+    create_tables_on_startup: bool = True
+    startup_warmup_enabled: bool = True
+    startup_warm_connections: int = Field(5, ge=0)
+    startup_retry_seconds: float = Field(2.0, gt=0)
+    startup_time_budget_seconds: float = Field(5.0, gt=0)
+    
+    # WebSocket 心跳 - 每隔 interval 秒送出 ping，超過 timeout 秒未收到任何訊息即視為閒置連線
+    ws_heartbeat_interval_seconds: float = Field(30.0, gt=0)
+    ws_heartbeat_timeout_seconds: float = Field(75.0, gt=0)
+    
+    # WebSocket 優雅關閉 - 分批通知客戶端重連，並附上隨機退避時間以避免同時重連
+    ws_drain_batch_size: int = Field(200, ge=1)
+    ws_drain_batch_interval_seconds: float = Field(0.5, ge=0)
+    ws_reconnect_backoff_min_ms: int = Field(1000, ge=0)
+    ws_reconnect_backoff_max_ms: int = Field(15000, ge=0)
+    ws_drain_write_timeout_seconds: float = Field(10.0, ge=0)
+    
+    # WebSocket permessage-deflate 壓縮（由 uvicorn 於握手時協商）
+    ws_per_message_deflate: bool = True
+    
+    # WebSocket 握手 - 每個 worker 每秒新連線數（權杖桶速率與瞬間上限）、同時連線上限，
+    # 以及任務存在與使用者快取的容量與有效秒數
+    ws_admission_rate_per_second: float = Field(200.0, gt=0)
+    ws_admission_burst: int = Field(400, ge=1)
+    ws_max_connections_per_worker: int = Field(20000, ge=1)
+    ws_handshake_cache_size: int = Field(10000, ge=1)
+    ws_handshake_cache_ttl_seconds: float = Field(60.0, ge=0)
+    
+    # 已刪除任務的背景清除作業
+    task_purge_interval_seconds: float = Field(60.0, gt=0)
+    task_purge_batch_size: int = Field(1000, ge=1)
+    
+    # 已完成任務封存作業 - 完成超過指定天數的任務與其留言移至封存表，分批處理並於批次間暫停
+    archive_after_days: int = Field(90, ge=1)
+    archive_batch_size: int = Field(100, ge=1)
+    archive_batch_pause_seconds: float = Field(0.5, ge=0)
+    
+    # REST 回應壓縮 - 依 Accept-Encoding 使用 brotli 或 gzip，小於門檻的回應不壓縮
+    compression_enabled: bool = True
+    compression_min_bytes: int = Field(1024, ge=0)
+    
+    # 大量匯入 - 每批以 executemany 寫入並提交的列數
+    import_batch_size: int = Field(1000, ge=1)
+    
+    # 效能追蹤 - 每個請求回傳 Server-Timing 標頭，超過門檻的查詢與請求寫入警告日誌
+    tracing_enabled: bool = True
+    slow_query_threshold_ms: float = Field(200.0, ge=0)
+    slow_request_threshold_ms: float = Field(1000.0, ge=0)
+    # 完整取樣剖析 - 依取樣率（0~1）或 X-Profile: 1 標頭（需啟用）擷取，保留最近幾筆供下載
+    profile_sample_rate: float = Field(0.0, ge=0, le=1)
+    profile_header_enabled: bool = False
+    profile_store_size: int = Field(20, ge=1)
+    
     class Config:
         # 在Docker容器中，.env檔案會被複製到應用根目錄
         env_file = ".env"
@@ -1,29 +1,207 @@
-from sqlalchemy import create_engine
+from itertools import count
+from typing import Dict, Optional
+from fastapi import Depends
+from fastapi.requests import HTTPConnection
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .config import settings
+from .security import verify_token
+import logging
+import math
+import time
 
-# 資料庫引擎
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    connect_args={
-        "init_command": f"SET time_zone = '+08:00'"
-    }
-)
+logger = logging.getLogger(__name__)
+
+
+def _create_engine(url: str):
+    """依資料庫類型建立引擎（MySQL 設定連線時區，SQLite 允許跨執行緒以便本機測試）"""
+    connect_args = {}
+    if url.startswith("mysql"):
+        connect_args["init_command"] = "SET time_zone = '+08:00'"
+    elif url.startswith("sqlite"):
+        connect_args["check_same_thread"] = False
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        connect_args=connect_args
+    )
+
+
+# 資料庫引擎（主庫，所有寫入）
+engine = _create_engine(settings.database_url)
+
+# 唯讀副本引擎（未設定時讀取也走主庫）
+replica_engines = [_create_engine(url) for url in settings.database_replica_urls]
+
+# 分片引擎（指定分片的工作區，其任務與留言存放於該分片，工作區與成員資料仍在主庫）
+shard_engines = {name: _create_engine(url) for name, url in settings.database_shard_urls.items()}
 
 # 會話工廠
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 # 模型基類
 Base = declarative_base()
 
+# 副本輪詢與健康狀態（副本索引 -> 恢復嘗試的時間點）
+_replica_counter = count()
+_replica_unhealthy_until: Dict[int, float] = {}
+
+# 讀己之寫：使用者（JWT sub）最近寫入後，在此時間點之前的讀取改走主庫（僅限同一程序）
+_sticky_until: Dict[str, float] = {}
+
+# 讀己之寫的 cookie：值為改走主庫的截止時間（Unix 秒），由任一 worker 或容器處理的讀取皆可判斷
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+# 請求寫入主庫後記錄於 ASGI scope，由 ReadYourWritesMiddleware 轉為 cookie
+_READ_PRIMARY_SCOPE_KEY = "read_primary_until"
+
+
+def _connection_user_key(conn: HTTPConnection) -> Optional[str]:
+    """從 Bearer 標頭或 WebSocket token 參數取得使用者識別（JWT sub）"""
+    authorization = conn.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else conn.query_params.get("token")
+    if not token:
+        return None
+    payload = verify_token(token)
+    return payload.get("sub") if payload else None
+
+
+def mark_recent_write(user_key: Optional[str]):
+    """記錄使用者剛寫入，短時間內的讀取固定走主庫"""
+    if not user_key or not replica_engines:
+        return
+    now = time.monotonic()
+    _sticky_until[user_key] = now + settings.read_your_writes_seconds
+    # 順便清理過期項目，避免無限成長
+    if len(_sticky_until) > 10000:
+        for key in [key for key, until in _sticky_until.items() if until <= now]:
+            del _sticky_until[key]
+
+
+def _is_sticky(conn: HTTPConnection) -> bool:
+    marker = conn.cookies.get(READ_YOUR_WRITES_COOKIE)
+    if marker:
+        try:
+            if float(marker) > time.time():
+                return True
+        except ValueError:
+            pass
+    if not _sticky_until:
+        return False
+    user_key = _connection_user_key(conn)
+    return user_key is not None and _sticky_until.get(user_key, 0) > time.monotonic()
+
+
+def mark_replica_unhealthy(index: int):
+    """暫停使用副本 replica_retry_seconds 秒，期間讀取改用其他副本或主庫"""
+    _replica_unhealthy_until[index] = time.monotonic() + settings.replica_retry_seconds
+
+
+def _open_replica_session() -> Optional[Session]:
+    """依序嘗試健康的副本，全部不可用時回傳 None"""
+    now = time.monotonic()
+    start = next(_replica_counter)
+    for offset in range(len(replica_engines)):
+        index = (start + offset) % len(replica_engines)
+        if _replica_unhealthy_until.get(index, 0) > now:
+            continue
+        db = ReadSessionLocal(bind=replica_engines[index])
+        try:
+            # 先取得連線（pool_pre_ping 會檢查連線狀態），失敗時改用其他副本或主庫
+            db.connection()
+        except OperationalError as e:
+            db.close()
+            mark_replica_unhealthy(index)
+            logger.warning(f"Read replica {index} unavailable, falling back: {e}")
+            continue
+        _replica_unhealthy_until.pop(index, None)
+        return db
+    return None
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_write(session: Session):
+    """主庫提交後記錄寫入者，供讀己之寫判斷"""
+    conn = session.info.get("connection")
+    if conn is not None and replica_engines:
+        mark_recent_write(_connection_user_key(conn))
+        conn.scope[_READ_PRIMARY_SCOPE_KEY] = time.time() + settings.read_your_writes_seconds
+
+
+class ReadYourWritesMiddleware:
+    """ASGI 中介層：請求寫入主庫後回傳短效 cookie，之後的讀取不論由哪個 worker 處理都改走主庫"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_engines:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_marker(message):
+            until = scope.get(_READ_PRIMARY_SCOPE_KEY)
+            if message["type"] == "http.response.start" and until is not None:
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; Max-Age={math.ceil(settings.read_your_writes_seconds)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_marker)
+
 
 # 資料庫依賴
-def get_db():
+def get_db(conn: HTTPConnection):
     db = SessionLocal()
+    db.info["connection"] = conn
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _open_routed_replica_session(conn: HTTPConnection) -> Optional[Session]:
+    """應路由至副本時開啟副本會話；沒有副本、最近寫入的使用者或副本皆不可用時回傳 None"""
+    if replica_engines and not _is_sticky(conn):
+        return _open_replica_session()
+    return None
+
+
+def open_read_session(conn: HTTPConnection) -> Session:
+    """開啟唯讀會話：路由至副本，最近寫入的使用者或副本皆不可用時改用主庫（呼叫端負責關閉）"""
+    db = _open_routed_replica_session(conn)
+    if db is None:
+        db = SessionLocal()
+    return db
+
+
+def open_shard_session(shard: Optional[str]) -> Session:
+    """開啟分片的會話（None 為主庫，呼叫端負責關閉）"""
+    if shard is None:
+        return SessionLocal()
+    return SessionLocal(bind=shard_engines[shard])
+
+
+def open_workspace_read_session(conn: HTTPConnection, shard: Optional[str]) -> Session:
+    """開啟工作區的唯讀會話：主庫的工作區可路由至副本，分片直接讀取分片（呼叫端負責關閉）"""
+    if shard is None:
+        return open_read_session(conn)
+    return open_shard_session(shard)
+
+
+# 唯讀資料庫依賴：不路由至副本時沿用請求的主庫會話（與 get_db 共用），
+# 身分驗證與寫入端點同一請求只佔用一條主庫連線（會話於第一次查詢時才取得連線）
+def get_read_db(conn: HTTPConnection, primary: Session = Depends(get_db)):
+    db = _open_routed_replica_session(conn)
+    if db is None:
+        yield primary
+        return
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,161 @@
+"""
+REST 回應的內容協商
+
+- Accept: application/msgpack 時以 MessagePack 編碼回應（NegotiatedResponse），其餘為 JSON
+- Accept-Encoding 含 br / gzip 時壓縮超過門檻的回應；串流回應逐段壓縮並立即送出
+- normalize_users：將列表中重複的使用者物件抽出為 users 清單，項目只保留使用者 id
+"""
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from fastapi.responses import JSONResponse
+from .config import settings
+import brotli
+import msgpack
+import zlib
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# 目前請求是否要求 MessagePack（由中介層依 Accept 標頭設定）
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1").lower()
+    return ""
+
+
+def _accepts(header: str, token: str) -> bool:
+    """檢查 Accept / Accept-Encoding 是否接受某個值（忽略 q=0）"""
+    for item in header.split(","):
+        value, _, params = item.strip().partition(";")
+        if value.strip() == token:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class NegotiatedResponse(JSONResponse):
+    """依 Accept 標頭輸出 JSON 或 MessagePack 的預設回應類別"""
+
+    def __init__(self, content: Any, *args, **kwargs):
+        if _wants_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+        super().__init__(content, *args, **kwargs)
+        self.headers.append("Vary", "Accept")
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPES[0]:
+            return msgpack.packb(content, default=str)
+        return super().render(content)
+
+
+def normalize_users(items: List[Dict], user_key: str, items_key: str) -> Dict[str, List[Dict]]:
+    """
+    將每個項目內嵌的使用者物件抽出，同一使用者只列出一次
+
+    參數:
+        items: 已轉為基本型別的項目（如任務或留言）
+        user_key: 項目中內嵌使用者的欄位（creator 或 user）
+        items_key: 回傳時項目清單的欄位名稱
+
+    回傳:
+        {"users": [...], items_key: [...]}，項目以原本的 created_by / user_id 對應使用者
+    """
+    users: Dict[int, Dict] = {}
+    normalized = []
+    for item in items:
+        item = dict(item)
+        user = item.pop(user_key, None)
+        if user:
+            users.setdefault(user["id"], user)
+        normalized.append(item)
+    return {"users": list(users.values()), items_key: normalized}
+
+
+class _Compressor:
+    """gzip 或 brotli 的串流壓縮器"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=4)
+        else:
+            self._zlib = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            output = self._brotli.process(data)
+            return output + (self._brotli.finish() if final else self._brotli.flush())
+        output = self._zlib.compress(data)
+        return output + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class ContentNegotiationMiddleware:
+    """ASGI 中介層：記錄是否要求 MessagePack，並依 Accept-Encoding 壓縮回應"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = _header(scope, b"accept")
+        token = _wants_msgpack.set(any(_accepts(accept, media_type) for media_type in MSGPACK_MEDIA_TYPES))
+        try:
+            encoding = self._select_encoding(_header(scope, b"accept-encoding"))
+            if encoding is None:
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, _CompressingSender(send, encoding))
+        finally:
+            _wants_msgpack.reset(token)
+
+    @staticmethod
+    def _select_encoding(accept_encoding: str) -> Optional[str]:
+        if not settings.compression_enabled:
+            return None
+        for encoding in ("br", "gzip"):
+            if _accepts(accept_encoding, encoding):
+                return encoding
+        return None
+
+
+class _CompressingSender:
+    """延後送出回應標頭，待第一段內容到達後決定是否壓縮"""
+
+    def __init__(self, send, encoding: str):
+        self.send = send
+        self.encoding = encoding
+        self.start_message: Optional[dict] = None
+        self.compressor: Optional[_Compressor] = None
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = list(start.get("headers", []))
+            # 已編碼或小於門檻的完整回應不壓縮；串流回應大小未知，一律壓縮
+            already_encoded = any(key.lower() == b"content-encoding" for key, _ in headers)
+            if not already_encoded and (more_body or len(body) >= settings.compression_min_bytes):
+                self.compressor = _Compressor(self.encoding)
+                body = self.compressor.compress(body, final=not more_body)
+                headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+                if not more_body:
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+                headers.append((b"vary", b"Accept-Encoding"))
+            await self.send({**start, "headers": headers})
+        elif self.compressor is not None:
+            body = self.compressor.compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
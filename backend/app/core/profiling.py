@@ -0,0 +1,258 @@
+"""
+請求層級的效能追蹤
+
+- ProfilingMiddleware：記錄每個請求的分段耗時（auth、db、handler、serialization、ws_broadcast），
+  以 Server-Timing 標頭回傳，超過門檻時寫入慢請求日誌
+- SQLAlchemy cursor 事件：統計每道 SQL 的耗時（正規化後記錄），超過門檻時寫入慢查詢日誌
+- 依取樣率或 X-Profile 標頭擷取單一請求的完整取樣剖析（pyinstrument），可於 /debug/profiles/{id} 下載
+  （production 只有發出該請求的使用者可下載）
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+from .security import verify_token
+import asyncio
+import functools
+import logging
+import random
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 單一請求保留的 SQL 明細上限
+MAX_RECORDED_STATEMENTS = 100
+
+
+class RequestTrace:
+    """單一請求的分段耗時（毫秒）"""
+
+    __slots__ = ("method", "path", "started", "spans", "counts", "statements", "endpoint_finished")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.statements: List[Tuple[str, float]] = []
+        self.endpoint_finished: Optional[float] = None
+
+    def add(self, name: str, elapsed_ms: float):
+        self.spans[name] = self.spans.get(name, 0.0) + elapsed_ms
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """轉為 Server-Timing 標頭格式"""
+        entries = [
+            f'{name};dur={duration:.1f};desc="{self.counts[name]}x"'
+            for name, duration in self.spans.items()
+        ]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+# 已擷取的剖析結果（profile_id -> (發出請求的使用者 JWT sub, HTML)），僅保留最近幾筆
+_profiles: "OrderedDict[str, Tuple[Optional[str], str]]" = OrderedDict()
+
+
+@contextmanager
+def span(name: str):
+    """記錄一段程式碼的耗時到目前請求（不在請求中時不做任何事）"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, (time.perf_counter() - started) * 1000)
+
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"IN \((?:\s*(?:%\(\w+\)s|\?|%s)\s*,?)+\)", re.IGNORECASE)
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|\?|\b\d+\b")
+
+
+def normalize_sql(statement: str) -> str:
+    """將 SQL 正規化（合併空白、參數與 IN 清單改為 ?），讓相同查詢可彙總"""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _IN_LIST.sub("IN (?)", statement)
+    return _PARAMETER.sub("?", statement)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_stack = conn.info.get("query_started")
+    if not started_stack:
+        return
+    elapsed_ms = (time.perf_counter() - started_stack.pop()) * 1000
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add("db", elapsed_ms)
+        if len(trace.statements) < MAX_RECORDED_STATEMENTS:
+            trace.statements.append((statement, elapsed_ms))
+
+    if elapsed_ms >= settings.slow_query_threshold_ms:
+        location = f" during {trace.method} {trace.path}" if trace is not None else ""
+        logger.warning(f"Slow query ({elapsed_ms:.1f}ms){location}: {normalize_sql(statement)}")
+
+
+class ProfiledRoute(APIRoute):
+    """記錄端點本體（handler）與回應序列化（serialization）耗時的路由類別"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+
+        async def profiled_route_handler(request):
+            response = await route_handler(request)
+            trace = _current_trace.get()
+            if trace is not None and trace.endpoint_finished is not None:
+                trace.add("serialization", (time.perf_counter() - trace.endpoint_finished) * 1000)
+            return response
+
+        return profiled_route_handler
+
+
+def _timed_endpoint(endpoint):
+    """包裝端點函式以記錄 handler 耗時（include_router 會重建路由，已包裝的不重複包裝）"""
+    if getattr(endpoint, "__profiled__", False):
+        return endpoint
+
+    def finish(started: float):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.endpoint_finished = time.perf_counter()
+            trace.add("handler", (trace.endpoint_finished - started) * 1000)
+
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                finish(started)
+    else:
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                finish(started)
+
+    timed.__profiled__ = True
+    return timed
+
+
+def _should_profile(scope) -> bool:
+    if settings.profile_header_enabled:
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile" and value in (b"1", b"true"):
+                return True
+    return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+
+def _request_user_key(scope) -> Optional[str]:
+    """從 Bearer 標頭取得發出請求的使用者（JWT sub）"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            authorization = value.decode("latin-1")
+            if authorization.lower().startswith("bearer "):
+                payload = verify_token(authorization[7:])
+                return payload.get("sub") if payload else None
+    return None
+
+
+def get_profile(profile_id: str, user_key: str) -> Optional[str]:
+    """
+    取得已擷取的剖析結果（HTML）
+
+    剖析含其他使用者請求的 SQL 與呼叫堆疊，production 只回傳給發出該請求的使用者
+    """
+    stored = _profiles.get(profile_id)
+    if stored is None:
+        return None
+    owner, html = stored
+    if settings.environment == "production" and owner != user_key:
+        return None
+    return html
+
+
+def _store_profile(profile_id: str, owner: Optional[str], html: str):
+    _profiles[profile_id] = (owner, html)
+    while len(_profiles) > settings.profile_store_size:
+        _profiles.popitem(last=False)
+
+
+class ProfilingMiddleware:
+    """ASGI 中介層：建立請求追蹤、附加 Server-Timing 標頭並記錄慢請求"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.tracing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        profiler = None
+        profile_id = None
+        if _should_profile(scope):
+            # 僅在需要時載入，避免拖慢啟動
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode="enabled")
+            profile_id = uuid.uuid4().hex
+            profiler.start()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                if profile_id is not None:
+                    headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                _store_profile(profile_id, _request_user_key(scope), profiler.output_html())
+
+            elapsed_ms = trace.elapsed_ms()
+            if elapsed_ms >= settings.slow_request_threshold_ms:
+                message = f"Slow request {trace.method} {trace.path} ({elapsed_ms:.1f}ms): {trace.server_timing()}"
+                slowest = sorted(trace.statements, key=lambda item: item[1], reverse=True)[:3]
+                if slowest:
+                    message += "; slowest queries: " + "; ".join(
+                        f"{duration:.1f}ms {normalize_sql(sql)}" for sql, duration in slowest
+                    )
+                logger.warning(message)
@@ -0,0 +1,120 @@
+"""
+列表端點的唯讀熱路徑查詢
+
+以 Core select() 只選取回應需要的欄位，資料列直接組成回應資料，
+不建立 ORM 物件（略過 identity map 與屬性追蹤）。
+語句依篩選與排序組合建立一次後快取，參數以 bindparam 帶入，
+每次請求重用同一語句物件，直接命中 SQLAlchemy 的編譯快取。
+"""
+from functools import lru_cache
+from typing import List, Optional
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session
+from ..models import DEFAULT_WORKSPACE_ID, ArchivedComment, Comment, Task, User
+from ..models.task import TaskStatus
+
+# 使用資料表欄位而非 ORM 屬性，執行時不經過 ORM 編譯
+_tasks = Task.__table__
+_users = User.__table__
+
+# 任務列表的排序（皆為倒序，相同時以建立時間倒序）
+_TASK_ORDER = {
+    "created_at": (_tasks.c.created_at.desc(),),
+    "last_comment_at": (_tasks.c.last_comment_at.desc(), _tasks.c.created_at.desc()),
+    "comment_count": (_tasks.c.comment_count.desc(), _tasks.c.created_at.desc())
+}
+
+
+@lru_cache(maxsize=None)
+def _task_list_statement(sort_by: str, by_status: bool):
+    statement = select(
+        _tasks.c.id, _tasks.c.title, _tasks.c.description, _tasks.c.status, _tasks.c.created_by,
+        _tasks.c.created_at, _tasks.c.updated_at, _tasks.c.version, _tasks.c.comment_count,
+        _tasks.c.last_comment_at, _users.c.email.label("creator_email")
+    ).join(_users, _users.c.id == _tasks.c.created_by).where(
+        _tasks.c.workspace_id == bindparam("workspace_id"),
+        _tasks.c.deleted_at.is_(None)
+    )
+    if by_status:
+        statement = statement.where(_tasks.c.status == bindparam("status"))
+    return statement.order_by(*_TASK_ORDER[sort_by])\
+        .offset(bindparam("skip"))\
+        .limit(bindparam("limit"))
+
+
+@lru_cache(maxsize=None)
+def _comment_list_statement(archived: bool):
+    comments = (ArchivedComment if archived else Comment).__table__
+    return select(
+        comments.c.id, comments.c.content, comments.c.task_id, comments.c.user_id,
+        comments.c.created_at, _users.c.email.label("user_email")
+    ).join(_users, _users.c.id == comments.c.user_id)\
+        .where(comments.c.task_id == bindparam("task_id"))\
+        .order_by(comments.c.created_at.asc())\
+        .offset(bindparam("skip"))\
+        .limit(bindparam("limit"))
+
+
+def list_tasks(
+    db: Session,
+    workspace_id: int,
+    status: Optional[TaskStatus],
+    sort_by: str,
+    skip: int,
+    limit: int
+) -> List[dict]:
+    """取得工作區未刪除的任務列表（欄位同 TaskWithCreator）"""
+    params = {"workspace_id": workspace_id, "skip": skip, "limit": limit}
+    if status:
+        params["status"] = status
+    rows = db.connection().execute(_task_list_statement(sort_by, status is not None), params)
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "description": row.description,
+            "status": row.status,
+            "created_by": row.created_by,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "version": row.version,
+            "comment_count": row.comment_count,
+            "last_comment_at": row.last_comment_at,
+            "creator": {
+                "id": row.created_by,
+                "email": row.creator_email
+            }
+        }
+        for row in rows
+    ]
+
+
+def list_comments(db: Session, task_id: int, skip: int, limit: int, archived: bool = False) -> List[dict]:
+    """取得任務的留言（按建立時間排序，欄位同 Comment；呼叫端須先確認任務屬於目前工作區）"""
+    rows = db.connection().execute(
+        _comment_list_statement(archived),
+        {"task_id": task_id, "skip": skip, "limit": limit}
+    )
+    return [
+        {
+            "id": row.id,
+            "content": row.content,
+            "task_id": row.task_id,
+            "user_id": row.user_id,
+            "created_at": row.created_at,
+            "user": {
+                "id": row.user_id,
+                "email": row.user_email
+            }
+        }
+        for row in rows
+    ]
+
+
+def warm_statements(db: Session):
+    """以不回傳資料列的參數執行每個快取語句，預先填入編譯快取"""
+    for sort_by in _TASK_ORDER:
+        for status in (None, TaskStatus.IN_PROGRESS):
+            list_tasks(db, DEFAULT_WORKSPACE_ID, status, sort_by, 0, 0)
+    for archived in (False, True):
+        list_comments(db, 0, 0, 0, archived=archived)
@@ -0,0 +1,149 @@
+"""
+API 程序的啟動與就緒狀態
+
+- 資料表：預設於啟動時建立尚未存在的資料表，可關閉並改於部署時執行 python -m app.jobs.create_tables
+- 預熱：於背景預先建立主庫、副本與分片的連線池連線、載入 bcrypt 後端並執行熱路徑查詢填入編譯快取，
+  主庫完成後才標記為就緒（/ready），/health 只代表程序存活；副本與分片預熱失敗只記錄警告，
+  失敗的副本標記為暫停使用，不影響就緒
+- 記錄由匯入到就緒的耗時，超過 startup_time_budget_seconds 時寫入警告
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import ReadSessionLocal, SessionLocal, engine, mark_replica_unhealthy, replica_engines, shard_engines
+from .security import pwd_context
+from .workspaces import ensure_default_workspace
+from ..models import Base
+
+logger = logging.getLogger(__name__)
+
+# 以會話執行的預熱函式（對主庫、每個副本與分片各執行一次，各引擎的編譯快取互相獨立）
+Warmer = Callable[[Session], None]
+
+
+class StartupState:
+    """程序的啟動耗時與是否已就緒"""
+
+    def __init__(self):
+        self.ready = False
+        self.import_seconds: Optional[float] = None
+        self.startup_seconds: Optional[float] = None
+        self.warmup_attempts = 0
+        self.last_error: Optional[str] = None
+
+    def get_status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "import_seconds": self.import_seconds,
+            "startup_seconds": self.startup_seconds,
+            "budget_seconds": settings.startup_time_budget_seconds,
+            "warmup_attempts": self.warmup_attempts,
+            "last_error": self.last_error
+        }
+
+
+startup_state = StartupState()
+
+
+def create_tables():
+    """於主庫與各分片建立尚未存在的資料表（不修改既有資料表），並建立預設工作區"""
+    for target_engine in [engine, *shard_engines.values()]:
+        Base.metadata.create_all(bind=target_engine)
+    db = SessionLocal()
+    try:
+        ensure_default_workspace(db)
+    finally:
+        db.close()
+
+
+def _warm_pool(target_engine, connections: int):
+    """同時借出多條連線再歸還，讓連線池保有已建立的連線"""
+    size = getattr(target_engine.pool, "size", None)
+    if callable(size):
+        # 超過 pool_size 的連線歸還時會被關閉，預熱無益
+        connections = min(connections, size())
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = target_engine.connect()
+            opened.append(connection)
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in opened:
+            connection.close()
+
+
+def _warm_engine(target_engine, open_session: Callable[[], Session], warmers: Iterable[Warmer]):
+    _warm_pool(target_engine, settings.startup_warm_connections)
+    db = open_session()
+    try:
+        for warmer in warmers:
+            warmer(db)
+    finally:
+        db.close()
+
+
+def warm_up(warmers: Iterable[Warmer]):
+    """預熱連線池、bcrypt 後端與熱路徑查詢（同步執行，主庫失敗時拋出例外）"""
+    # passlib 於第一次雜湊或驗證時才載入 bcrypt 後端
+    pwd_context.handler().get_backend()
+
+    _warm_engine(engine, SessionLocal, warmers)
+
+    # 讀取已可退回主庫，副本不可用時不阻擋就緒
+    for index, replica in enumerate(replica_engines):
+        try:
+            _warm_engine(replica, lambda: ReadSessionLocal(bind=replica), warmers)
+        except Exception as e:
+            mark_replica_unhealthy(index)
+            logger.warning(f"Read replica {index} warm-up failed, marked unhealthy: {e}")
+
+    # 分片不可用時只影響其工作區的請求
+    for name, shard in shard_engines.items():
+        try:
+            _warm_engine(shard, lambda: SessionLocal(bind=shard), warmers)
+        except Exception as e:
+            logger.warning(f"Shard {name} warm-up failed: {e}")
+
+
+async def run_warm_up(warmers: Iterable[Warmer], started_at: float):
+    """
+    於背景預熱直到成功（資料庫尚未可用時依間隔重試），完成後標記為就緒
+
+    參數:
+        warmers: 熱路徑查詢的預熱函式
+        started_at: 程序開始匯入應用的時間點（time.perf_counter）
+    """
+    warmers = list(warmers)
+    while True:
+        startup_state.warmup_attempts += 1
+        try:
+            # 與同步依賴項使用相同的執行緒池，一併載入 anyio 後端並建立工作執行緒
+            await run_in_threadpool(warm_up, warmers)
+            break
+        except Exception as e:
+            startup_state.last_error = type(e).__name__
+            logger.warning(f"Startup warm-up attempt {startup_state.warmup_attempts} failed, retrying: {e}")
+            await asyncio.sleep(settings.startup_retry_seconds)
+    mark_ready(started_at)
+
+
+def mark_ready(started_at: float):
+    startup_state.startup_seconds = time.perf_counter() - started_at
+    startup_state.last_error = None
+    startup_state.ready = True
+
+    budget = settings.startup_time_budget_seconds
+    if startup_state.startup_seconds > budget:
+        logger.warning(
+            f"Startup took {startup_state.startup_seconds:.2f}s, over the {budget:.2f}s budget "
+            f"(import {startup_state.import_seconds:.2f}s)"
+        )
+    else:
+        logger.info(
+            f"Ready in {startup_state.startup_seconds:.2f}s (import {startup_state.import_seconds:.2f}s)"
+        )
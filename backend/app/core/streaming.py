@@ -0,0 +1,135 @@
+"""
+大量資料串流匯出入（NDJSON / CSV）
+
+- 匯出：以伺服器端游標（yield_per）分批讀取並逐批輸出，記憶體用量與資料表大小無關
+- 匯入：邊讀取請求本體邊處理，並以 NDJSON 逐批回報進度
+"""
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Callable, Iterator, Literal, Optional, Sequence
+from fastapi.requests import HTTPConnection
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+from sqlalchemy import Select
+from .database import open_workspace_read_session
+import csv
+import io
+import json
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+
+def _plain(value):
+    """轉為可直接輸出的基本型別"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _stream_rows(
+    conn: HTTPConnection,
+    statement: Select,
+    fields: Sequence[str],
+    export_format: ExportFormat,
+    batch_size: int,
+    shard: Optional[str]
+) -> Iterator[str]:
+    # 串流在端點返回後才執行，需自行開啟與關閉會話
+    db = open_workspace_read_session(conn, shard)
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == "csv" else None
+        if writer is not None:
+            # 加上 BOM 讓 Excel 正確辨識 UTF-8
+            buffer.write("\ufeff")
+            writer.writerow(fields)
+        
+        for partition in result.partitions():
+            for row in partition:
+                values = [_plain(value) for value in row]
+                if writer is not None:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(fields, values)), ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+def export_response(
+    conn: HTTPConnection,
+    statement: Select,
+    fields: Sequence[str],
+    export_format: ExportFormat,
+    filename: str,
+    batch_size: int = 1000,
+    shard: Optional[str] = None
+) -> StreamingResponse:
+    """
+    建立串流匯出回應
+    
+    參數:
+        conn: 目前的請求（用於唯讀路由）
+        statement: 要匯出的查詢，選取欄位順序需與 fields 相同
+        fields: 輸出欄位名稱
+        export_format: ndjson 或 csv
+        filename: 下載檔名（不含副檔名）
+        batch_size: 每批從資料庫讀取的列數
+        shard: 工作區所在的分片（None 為主庫，可路由至副本）
+    """
+    return StreamingResponse(
+        _stream_rows(conn, statement, fields, export_format, batch_size, shard),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
+
+
+class NDJSONUploadResponse(Response):
+    """
+    邊讀取請求本體邊處理的回應，將 handler 產生的事件逐行以 NDJSON 送出
+
+    StreamingResponse 會同時監聽斷線而讀走請求本體，因此直接實作 ASGI 介面，
+    送出回應標頭後再自行讀取本體。客戶端中途斷線時 handler 會收到 ClientDisconnect。
+    """
+
+    media_type = MEDIA_TYPES["ndjson"]
+
+    def __init__(self, handler: Callable[[AsyncIterator[bytes]], AsyncIterator[dict]]):
+        self.handler = handler
+        self.status_code = 200
+        self.background = None
+        self.raw_headers = [(b"content-type", self.media_type.encode("latin-1"))]
+
+    async def __call__(self, scope, receive, send):
+        async def chunks():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    raise ClientDisconnect()
+                yield message.get("body", b"")
+                if not message.get("more_body", False):
+                    return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        try:
+            async for event in self.handler(chunks()):
+                line = json.dumps(event, ensure_ascii=False) + "\n"
+                await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        except ClientDisconnect:
+            # 客戶端已離開，已提交的批次保留，未提交的部分由 handler 捨棄
+            return
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
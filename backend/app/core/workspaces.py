@@ -0,0 +1,80 @@
+"""
+工作區的存取與分片路由
+
+- 工作區與成員資料存放於主庫；指定分片的工作區，其任務、留言與統計存放於該分片
+- 分片的資料表與主庫相同，工作區與成員使用者會複製到分片，讓外鍵與使用者關聯查詢照常運作
+- worker 可設定只服務特定分片（settings.worker_shards），其他分片的請求回傳 421 並於 X-Workspace-Shard 標頭
+  指出正確的分片，供前端代理依工作區導流
+"""
+from typing import Iterable, NamedTuple, Optional
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import open_shard_session
+from ..models import DEFAULT_WORKSPACE_ID, User, Workspace, WorkspaceMember
+
+# 主庫在 worker_shards 與 X-Workspace-Shard 標頭中的名稱
+DEFAULT_SHARD = "default"
+
+WORKSPACE_HEADER = "x-workspace-id"
+WORKSPACE_QUERY_PARAM = "workspace_id"
+SHARD_HEADER = "X-Workspace-Shard"
+
+
+class WorkspaceContext(NamedTuple):
+    id: int
+    shard: Optional[str]
+
+    @property
+    def shard_name(self) -> str:
+        return self.shard or DEFAULT_SHARD
+
+
+def resolve_workspace(db: Session, workspace_id: int, user_id: int) -> Optional[WorkspaceContext]:
+    """工作區存在且使用者可存取時回傳（預設工作區所有使用者皆可存取），db 須為主庫或其副本"""
+    row = db.execute(
+        select(Workspace.id, Workspace.shard, WorkspaceMember.user_id)
+        .outerjoin(WorkspaceMember, and_(
+            WorkspaceMember.workspace_id == Workspace.id,
+            WorkspaceMember.user_id == user_id
+        ))
+        .where(Workspace.id == workspace_id)
+    ).first()
+    if row is None or (row.user_id is None and row.id != DEFAULT_WORKSPACE_ID):
+        return None
+    return WorkspaceContext(row.id, row.shard)
+
+
+def serves_shard(shard: Optional[str]) -> bool:
+    """此 worker 是否服務該分片的工作區"""
+    return not settings.worker_shards or (shard or DEFAULT_SHARD) in settings.worker_shards
+
+
+def ensure_default_workspace(db: Session):
+    """建立預設工作區（已存在時略過），既有任務與留言皆屬於此工作區"""
+    if db.get(Workspace, DEFAULT_WORKSPACE_ID) is None:
+        db.add(Workspace(id=DEFAULT_WORKSPACE_ID, name="預設工作區"))
+        db.commit()
+
+
+def copy_to_shard(shard: Optional[str], workspace: Optional[Workspace] = None, users: Iterable[User] = ()):
+    """將工作區與使用者複製到分片（以相同 id 寫入或更新），主庫的工作區不需複製"""
+    if shard is None:
+        return
+    db = open_shard_session(shard)
+    try:
+        for user in users:
+            db.merge(User(
+                id=user.id, email=user.email, password_hash=user.password_hash,
+                created_at=user.created_at, updated_at=user.updated_at
+            ))
+        if workspace is not None:
+            # 先寫入使用者，工作區的 created_by 參照使用者
+            db.flush()
+            db.merge(Workspace(
+                id=workspace.id, name=workspace.name, shard=workspace.shard,
+                created_by=workspace.created_by, created_at=workspace.created_at
+            ))
+        db.commit()
+    finally:
+        db.close()
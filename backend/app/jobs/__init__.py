@@ -0,0 +1 @@
+# 背景與維運作業
\ No newline at end of file
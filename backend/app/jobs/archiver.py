@@ -0,0 +1,129 @@
+"""
+已完成任務封存作業
+
+將完成超過指定天數的任務及其留言移至 tasks_archive / comments_archive，
+讓日常查詢只需掃描仍在使用的資料。任務以完成後最後一次更新時間（updated_at）判斷完成時間，
+期間仍有留言（last_comment_at，留言不更新 updated_at）的任務視為仍在使用，不封存。
+每批任務在單一交易內複製並刪除，批次之間暫停以降低對線上流量的影響。
+
+執行方式（於 backend 目錄，建議以排程執行）:
+    python -m app.jobs.archiver --days 90 --batch-size 100
+    python -m app.jobs.archiver --shard large-tenant
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import open_shard_session
+from ..models import ArchivedComment, ArchivedTask, Comment, Task, TaskStatus
+from .rollups import to_local
+
+logger = logging.getLogger(__name__)
+
+# 封存表與原表共用的欄位
+TASK_COLUMNS = (
+    "id", "workspace_id", "title", "description", "status", "created_by",
+    "created_at", "updated_at", "version", "comment_count", "last_comment_at"
+)
+COMMENT_COLUMNS = ("id", "workspace_id", "content", "task_id", "user_id", "created_at")
+
+
+def archive_completed_tasks(
+    db: Session,
+    older_than_days: int,
+    batch_size: int = 100,
+    batch_pause: float = 0.0,
+    max_batches: int = None
+) -> int:
+    """
+    分批封存已完成的任務及其留言
+    
+    參數:
+        db: 資料庫會話
+        older_than_days: 完成超過幾天的任務才封存
+        batch_size: 每批封存的任務數量
+        batch_pause: 批次之間暫停的秒數
+        max_batches: 最多處理的批次數（None 表示處理到沒有符合條件的任務）
+    
+    回傳:
+        封存的任務數量
+    """
+    # 資料庫連線使用 settings.timezone 的當地時間，不依賴容器的時區設定
+    cutoff = to_local(datetime.now(timezone.utc)) - timedelta(days=older_than_days)
+    archived = 0
+    batches = 0
+    
+    while max_batches is None or batches < max_batches:
+        task_ids = db.execute(
+            select(Task.id)
+            .where(
+                Task.status == TaskStatus.COMPLETED,
+                Task.updated_at < cutoff,
+                or_(Task.last_comment_at.is_(None), Task.last_comment_at < cutoff),
+                Task.deleted_at.is_(None)
+            )
+            .order_by(Task.id)
+            .limit(batch_size)
+            # 鎖定任務列，留言寫入（先更新任務列）須等封存交易完成，之後找不到任務而不會寫入
+            .with_for_update()
+        ).scalars().all()
+        if not task_ids:
+            break
+        
+        # 複製後刪除，同一交易內完成以避免資料同時存在於兩邊或遺失
+        db.execute(
+            insert(ArchivedTask).from_select(
+                TASK_COLUMNS,
+                select(*(getattr(Task, column) for column in TASK_COLUMNS)).where(Task.id.in_(task_ids))
+            )
+        )
+        db.execute(
+            insert(ArchivedComment).from_select(
+                COMMENT_COLUMNS,
+                select(*(getattr(Comment, column) for column in COMMENT_COLUMNS)).where(Comment.task_id.in_(task_ids))
+            )
+        )
+        db.execute(delete(Comment).where(Comment.task_id.in_(task_ids)))
+        db.execute(delete(Task).where(Task.id.in_(task_ids)))
+        db.commit()
+        
+        archived += len(task_ids)
+        batches += 1
+        logger.info(f"Archived {archived} tasks (up to id {task_ids[-1]})")
+        
+        if batch_pause > 0:
+            time.sleep(batch_pause)
+    
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="封存已完成的任務與留言")
+    parser.add_argument("--days", type=int, default=settings.archive_after_days, help="完成超過幾天的任務才封存")
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size, help="每批封存的任務數量")
+    parser.add_argument("--pause", type=float, default=settings.archive_batch_pause_seconds, help="批次之間暫停的秒數")
+    parser.add_argument("--max-batches", type=int, default=None, help="最多處理的批次數")
+    parser.add_argument("--shard", help="封存指定分片的任務（預設為主庫）")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    db = open_shard_session(args.shard)
+    try:
+        total = archive_completed_tasks(
+            db,
+            older_than_days=args.days,
+            batch_size=args.batch_size,
+            batch_pause=args.pause,
+            max_batches=args.max_batches
+        )
+    finally:
+        db.close()
+    logger.info(f"Done, {total} tasks archived")
+
+
+if __name__ == "__main__":
+    main()
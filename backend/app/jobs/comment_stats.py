@@ -0,0 +1,85 @@
+"""
+任務留言統計修復作業
+
+以留言表重新計算每個任務的 comment_count 與 last_comment_at，
+依主鍵範圍分批更新，每批各自提交以避免長時間鎖表。
+
+執行方式（於 backend 目錄）:
+    python -m app.jobs.comment_stats --batch-size 1000
+    python -m app.jobs.comment_stats --shard large-tenant
+"""
+import argparse
+import logging
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ..core.database import open_shard_session
+from ..models import Comment, Task
+
+logger = logging.getLogger(__name__)
+
+
+def recompute_comment_stats(db: Session, batch_size: int = 1000) -> int:
+    """
+    分批重新計算所有任務的留言統計
+    
+    參數:
+        db: 資料庫會話
+        batch_size: 每批處理的任務數量
+    
+    回傳:
+        處理的任務數量
+    """
+    comment_count = select(func.count(Comment.id))\
+        .where(Comment.task_id == Task.id)\
+        .scalar_subquery()
+    last_comment_at = select(func.max(Comment.created_at))\
+        .where(Comment.task_id == Task.id)\
+        .scalar_subquery()
+    
+    processed = 0
+    last_id = 0
+    while True:
+        task_ids = db.execute(
+            select(Task.id).where(Task.id > last_id).order_by(Task.id).limit(batch_size)
+        ).scalars().all()
+        if not task_ids:
+            break
+        
+        db.execute(
+            update(Task)
+            .where(Task.id.between(task_ids[0], task_ids[-1]))
+            .values(
+                comment_count=comment_count,
+                last_comment_at=last_comment_at,
+                # 修復統計不應改變任務的更新時間
+                updated_at=Task.updated_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        
+        processed += len(task_ids)
+        last_id = task_ids[-1]
+        logger.info(f"Recomputed comment stats for {processed} tasks (up to id {last_id})")
+    
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重新計算任務的留言數與最後留言時間")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批處理的任務數量")
+    parser.add_argument("--shard", help="重新計算指定分片的任務（預設為主庫）")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    db = open_shard_session(args.shard)
+    try:
+        total = recompute_comment_stats(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    logger.info(f"Done, {total} tasks recomputed")
+
+
+if __name__ == "__main__":
+    main()
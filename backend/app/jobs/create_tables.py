@@ -0,0 +1,30 @@
+"""
+建立資料表
+
+關閉啟動時建立資料表（settings.create_tables_on_startup）時，
+首次部署或新增資料表時於部署流程中執行此作業；既有資料表不會被修改。
+
+執行方式（於 backend 目錄）:
+    python -m app.jobs.create_tables
+"""
+import argparse
+import logging
+import time
+
+from ..core.startup import create_tables
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立尚未存在的資料表")
+    parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    create_tables()
+    logger.info(f"Done, tables created in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
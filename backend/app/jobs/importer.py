@@ -0,0 +1,385 @@
+"""
+任務與留言大量匯入
+
+以串流方式讀取 NDJSON / CSV，逐列以 TaskCreate / CommentImport 驗證，
+累積成批後以 executemany 寫入，每批各自提交並回報進度與錯誤列。
+中斷後以最後回報的已處理列數（rows）作為 resume_from 重新匯入同一份檔案，即可略過已提交的資料。
+
+執行方式（於 backend 目錄）:
+    python -m app.jobs.importer tasks tasks.ndjson --user-email admin@example.com
+    python -m app.jobs.importer comments comments.csv --user-email admin@example.com --checkpoint comments.ckpt
+    python -m app.jobs.importer tasks tasks.ndjson --user-email admin@example.com --workspace-id 2
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import os
+from collections import Counter
+from typing import AsyncIterator, Iterator, List, Literal, Optional, Tuple
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal, open_shard_session
+from ..core.workspaces import resolve_workspace
+from ..models import DEFAULT_WORKSPACE_ID, Comment, Task, User
+from ..models.task import TaskStatus
+from ..schemas import CommentImport, TaskCreate
+from .rollups import TASKS_CREATED, record_activity, record_comment_activity
+
+logger = logging.getLogger(__name__)
+
+ImportKind = Literal["tasks", "comments"]
+ImportFormat = Literal["ndjson", "csv"]
+
+# 解析結果：(資料列編號, 欄位, 錯誤訊息)
+Record = Tuple[int, Optional[dict], Optional[str]]
+
+# 讀取檔案的區塊大小
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class RecordParser:
+    """
+    將分段到達的文字解析為資料列
+
+    資料列編號從 1 開始，不含 CSV 標題列與空白列，重新匯入同一份檔案時編號一致。
+    CSV 以引號數量的奇偶判斷欄位內是否含換行，必要時合併多行為同一筆資料。
+    """
+
+    def __init__(self, format: ImportFormat):
+        self.format = format
+        self.header: Optional[List[str]] = None
+        self.row_number = 0
+        self._partial = ""
+        self._record_lines: List[str] = []
+        self._quotes = 0
+
+    def feed(self, text: str) -> List[Record]:
+        self._partial += text
+        *lines, self._partial = self._partial.split("\n")
+        records: List[Record] = []
+        for line in lines:
+            self._parse_line(line, records)
+        return records
+
+    def close(self) -> List[Record]:
+        records: List[Record] = []
+        if self._partial:
+            self._parse_line(self._partial, records)
+            self._partial = ""
+        if self._record_lines:
+            self._record_lines = []
+            self.row_number += 1
+            records.append((self.row_number, None, "CSV 引號未閉合"))
+        return records
+
+    def _parse_line(self, line: str, records: List[Record]):
+        if self.format == "csv":
+            self._record_lines.append(line)
+            self._quotes += line.count('"')
+            if self._quotes % 2:
+                return
+            record = "\n".join(self._record_lines)
+            self._record_lines = []
+            self._quotes = 0
+            self._parse_csv_record(record, records)
+            return
+
+        line = line.strip()
+        if not line:
+            return
+        self.row_number += 1
+        try:
+            data = json.loads(line)
+        except ValueError:
+            records.append((self.row_number, None, "無效的 JSON"))
+            return
+        if not isinstance(data, dict):
+            records.append((self.row_number, None, "每列須為 JSON 物件"))
+            return
+        records.append((self.row_number, data, None))
+
+    def _parse_csv_record(self, record: str, records: List[Record]):
+        if not record.strip():
+            return
+        values = next(csv.reader([record]))
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            return
+        self.row_number += 1
+        if len(values) != len(self.header):
+            records.append((self.row_number, None, "欄位數量與標題列不符"))
+            return
+        # CSV 無法區分空字串與未填，空欄位視為未填
+        records.append((self.row_number, {
+            name: value if value != "" else None
+            for name, value in zip(self.header, values)
+        }, None))
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+class BulkImporter:
+    """
+    驗證資料列並分批寫入
+
+    參數:
+        kind: tasks 或 comments
+        user_id: 匯入資料的建立者
+        batch_size: 每批寫入並提交的列數
+        resume_from: 略過編號小於等於此值的資料列（先前已處理）
+        workspace_id: 匯入的工作區（寫入的會話須為工作區所在的分片）
+    """
+
+    def __init__(
+        self,
+        kind: ImportKind,
+        user_id: int,
+        batch_size: int = 1000,
+        resume_from: int = 0,
+        workspace_id: int = DEFAULT_WORKSPACE_ID
+    ):
+        self.kind = kind
+        self.user_id = user_id
+        self.workspace_id = workspace_id
+        self.batch_size = batch_size
+        self.resume_from = resume_from
+        self.schema = TaskCreate if kind == "tasks" else CommentImport
+        self.pending: List[Tuple[int, BaseModel]] = []
+        self.errors: List[Tuple[int, str]] = []
+        # 已提交的最後一列編號，中斷後作為 resume_from
+        self.rows = resume_from
+        self.inserted = 0
+        self.failed = 0
+        self._last_row = resume_from
+
+    @property
+    def ready(self) -> bool:
+        # 錯誤列也計入批次，大量無效資料時同樣定期回報進度並限制記憶體用量
+        return len(self.pending) + len(self.errors) >= self.batch_size
+
+    def add(self, row_number: int, data: Optional[dict], error: Optional[str]):
+        if row_number <= self.resume_from:
+            return
+        self._last_row = row_number
+        if error is None:
+            try:
+                self.pending.append((row_number, self.schema.model_validate(data)))
+                return
+            except ValidationError as e:
+                error = _format_validation_error(e)
+        self._fail(row_number, error)
+
+    def _fail(self, row_number: int, message: str):
+        self.failed += 1
+        self.errors.append((row_number, message))
+
+    def flush(self, db: Session) -> List[dict]:
+        """
+        寫入並提交目前累積的資料列
+
+        回傳:
+            本批的錯誤列與進度事件
+        """
+        if not self.pending and not self.errors and self.rows == self._last_row:
+            return []
+        items, self.pending = self.pending, []
+        if items:
+            if self.kind == "tasks":
+                inserted = self._insert_tasks(db, items)
+            else:
+                inserted = self._insert_comments(db, items)
+            db.commit()
+            self.inserted += inserted
+        self.rows = self._last_row
+
+        events = [{"type": "error", "row": row, "message": message} for row, message in self.errors]
+        self.errors = []
+        events.append(self.progress("progress"))
+        logger.info(f"Imported {self.kind}: {self.rows} rows processed, {self.inserted} inserted, {self.failed} failed")
+        return events
+
+    def progress(self, event_type: str) -> dict:
+        return {"type": event_type, "rows": self.rows, "inserted": self.inserted, "failed": self.failed}
+
+    def _insert_tasks(self, db: Session, items: List[Tuple[int, TaskCreate]]) -> int:
+        db.execute(insert(Task.__table__), [
+            {
+                "title": item.title,
+                "description": item.description,
+                "status": TaskStatus.IN_PROGRESS,
+                "created_by": self.user_id,
+                "workspace_id": self.workspace_id
+            }
+            for _, item in items
+        ])
+        record_activity(db, self.workspace_id, TASKS_CREATED, len(items))
+        return len(items)
+
+    def _insert_comments(self, db: Session, items: List[Tuple[int, CommentImport]]) -> int:
+        task_ids = {item.task_id for _, item in items}
+        existing = set(db.execute(
+            select(Task.id).where(
+                Task.id.in_(task_ids), Task.workspace_id == self.workspace_id, Task.deleted_at.is_(None)
+            )
+        ).scalars())
+
+        valid = []
+        for row_number, item in items:
+            if item.task_id in existing:
+                valid.append(item)
+            else:
+                self._fail(row_number, "找不到任務")
+        if not valid:
+            return 0
+
+        # 與 increment_comment_stats 相同先更新任務列再新增留言，並依任務 id 排序以固定鎖定順序
+        tasks = Task.__table__
+        counts = Counter(item.task_id for item in valid)
+        db.execute(
+            update(tasks)
+            .where(tasks.c.id == bindparam("b_task_id"))
+            .values(
+                comment_count=tasks.c.comment_count + bindparam("b_count"),
+                last_comment_at=func.now(),
+                updated_at=tasks.c.updated_at
+            ),
+            [{"b_task_id": task_id, "b_count": count} for task_id, count in sorted(counts.items())]
+        )
+        db.execute(insert(Comment.__table__), [
+            {
+                "content": item.content,
+                "task_id": item.task_id,
+                "user_id": self.user_id,
+                "workspace_id": self.workspace_id
+            }
+            for item in valid
+        ])
+        record_comment_activity(db, self.workspace_id, counts)
+        return len(valid)
+
+
+def _failure_event(importer: BulkImporter, db: Session, error: SQLAlchemyError) -> dict:
+    db.rollback()
+    logger.error(f"Import of {importer.kind} failed after row {importer.rows}: {error}")
+    return {**importer.progress("failed"), "message": "寫入資料庫時發生錯誤，可由 rows 繼續匯入"}
+
+
+async def import_stream(
+    chunks: AsyncIterator[bytes],
+    parser: RecordParser,
+    importer: BulkImporter,
+    db: Session
+) -> AsyncIterator[dict]:
+    """匯入非同步到達的位元組串流（如 HTTP 請求本體），逐批產生進度事件"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    try:
+        async for chunk in chunks:
+            for record in parser.feed(decoder.decode(chunk)):
+                importer.add(*record)
+                if importer.ready:
+                    # 寫入在執行緒中進行，避免大量寫入阻塞事件迴圈
+                    for event in await asyncio.to_thread(importer.flush, db):
+                        yield event
+
+        for record in parser.feed(decoder.decode(b"", final=True)) + parser.close():
+            importer.add(*record)
+            if importer.ready:
+                for event in await asyncio.to_thread(importer.flush, db):
+                    yield event
+        for event in await asyncio.to_thread(importer.flush, db):
+            yield event
+    except SQLAlchemyError as e:
+        yield _failure_event(importer, db, e)
+        return
+    yield importer.progress("done")
+
+
+def import_file(file, parser: RecordParser, importer: BulkImporter, db: Session) -> Iterator[dict]:
+    """匯入本機檔案（以二進位模式開啟），逐批產生進度事件"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    try:
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            records = parser.feed(decoder.decode(chunk, final=not chunk))
+            if not chunk:
+                records += parser.close()
+            for record in records:
+                importer.add(*record)
+                if importer.ready:
+                    yield from importer.flush(db)
+            if not chunk:
+                break
+        yield from importer.flush(db)
+    except SQLAlchemyError as e:
+        yield _failure_event(importer, db, e)
+        return
+    yield importer.progress("done")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由 NDJSON / CSV 檔案大量匯入任務或留言")
+    parser.add_argument("kind", choices=["tasks", "comments"], help="匯入的資料類型")
+    parser.add_argument("path", help="匯入檔案路徑")
+    parser.add_argument("--user-email", required=True, help="匯入資料的建立者")
+    parser.add_argument("--workspace-id", type=int, default=DEFAULT_WORKSPACE_ID, help="匯入的工作區")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="檔案格式（預設依副檔名判斷）")
+    parser.add_argument("--batch-size", type=int, default=settings.import_batch_size, help="每批寫入並提交的列數")
+    parser.add_argument("--resume-from", type=int, default=0, help="略過已處理的資料列數")
+    parser.add_argument("--checkpoint", help="記錄已處理列數的檔案，存在時自動由該處繼續")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    resume_from = args.resume_from
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as f:
+            resume_from = int(f.read().strip() or 0)
+        logger.info(f"Resuming from row {resume_from}")
+
+    # 使用者與工作區查詢主庫，再寫入工作區所在的分片
+    catalog = SessionLocal()
+    try:
+        user = catalog.query(User).filter(User.email == args.user_email).first()
+        if user is None:
+            parser.error(f"找不到使用者: {args.user_email}")
+        workspace = resolve_workspace(catalog, args.workspace_id, user.id)
+        if workspace is None:
+            parser.error(f"使用者無法存取工作區: {args.workspace_id}")
+    finally:
+        catalog.close()
+
+    db = open_shard_session(workspace.shard)
+    try:
+        importer = BulkImporter(
+            args.kind, user.id, batch_size=args.batch_size, resume_from=resume_from, workspace_id=workspace.id
+        )
+        with open(args.path, "rb") as f:
+            for event in import_file(f, RecordParser(format), importer, db):
+                if event["type"] == "error":
+                    logger.warning(f"Row {event['row']}: {event['message']}")
+                    continue
+                if args.checkpoint:
+                    with open(args.checkpoint, "w") as checkpoint:
+                        checkpoint.write(str(event["rows"]))
+                if event["type"] == "failed":
+                    raise SystemExit(f"Import stopped, resume with --resume-from {event['rows']}")
+    finally:
+        db.close()
+
+    logger.info(f"Done, {importer.inserted} inserted, {importer.failed} failed, {importer.rows} rows processed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+活動統計（時間序列）
+
+任務與留言的寫入路徑在同一交易內遞增每個工作區每小時的計數（activity_rollups、task_comment_rollups），
+統計查詢只讀取這些彙總表。時間以 settings.timezone 的當地時間分桶。
+此作業由原始資料表（含封存表）重建彙總，用於首次啟用或修正誤差；
+任務完成時間沒有歷史紀錄，重建時以已完成任務的 updated_at 近似。
+
+執行方式（於 backend 目錄）:
+    python -m app.jobs.rollups --batch-size 5000
+    python -m app.jobs.rollups --shard large-tenant
+"""
+import argparse
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import open_shard_session
+from ..models import ActivityRollup, ArchivedComment, ArchivedTask, Comment, Task, TaskCommentRollup
+from ..models.task import TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# 統計項目
+TASKS_CREATED = "tasks_created"
+TASKS_COMPLETED = "tasks_completed"
+COMMENTS_CREATED = "comments_created"
+METRICS = (TASKS_CREATED, TASKS_COMPLETED, COMMENTS_CREATED)
+
+# 查詢時可用的區間大小
+BUCKET_SIZES = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1)
+}
+
+_UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+
+def to_local(at: datetime) -> datetime:
+    """轉為當地時間（不含時區，與資料庫中的時間欄位一致）"""
+    if at.tzinfo is not None:
+        at = at.astimezone(ZoneInfo(settings.timezone)).replace(tzinfo=None)
+    return at
+
+
+def bucket_start(at: datetime, bucket: str = "hour") -> datetime:
+    """取得時間所屬區間的起點（週以星期一為起點）"""
+    at = to_local(at)
+    if bucket == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def current_hour() -> datetime:
+    return bucket_start(datetime.now(ZoneInfo(settings.timezone)))
+
+
+def _increment(db: Session, model, rows: List[dict]):
+    """以 upsert 累加計數（依主鍵排序，讓同時寫入的交易以相同順序鎖定）"""
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key]
+    rows = sorted(rows, key=lambda row: tuple(row[key] for key in keys))
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("mysql", "mariadb"):
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(count=table.c["count"] + statement.inserted["count"])
+    else:
+        if dialect not in _UPSERT_DIALECTS:
+            raise NotImplementedError(f"Activity rollups do not support the {dialect} dialect")
+        statement = _UPSERT_DIALECTS[dialect].insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={"count": table.c["count"] + statement.excluded["count"]}
+        )
+    db.execute(statement, rows)
+
+
+def record_activity(db: Session, workspace_id: int, metric: str, amount: int = 1, at: Optional[datetime] = None):
+    """於目前交易遞增工作區的一項活動統計（由呼叫端提交）"""
+    _increment(db, ActivityRollup, [{
+        "workspace_id": workspace_id,
+        "bucket_start": bucket_start(at) if at else current_hour(),
+        "metric": metric,
+        "count": amount
+    }])
+
+
+def record_comment_activity(
+    db: Session,
+    workspace_id: int,
+    counts: Dict[int, int],
+    at: Optional[datetime] = None
+):
+    """於目前交易遞增各任務的留言統計（task_id -> 新增留言數）與工作區的留言統計"""
+    if not counts:
+        return
+    hour = bucket_start(at) if at else current_hour()
+    _increment(db, TaskCommentRollup, [
+        {"task_id": task_id, "bucket_start": hour, "count": count}
+        for task_id, count in counts.items()
+    ])
+    record_activity(db, workspace_id, COMMENTS_CREATED, sum(counts.values()), at=hour)
+
+
+def _backfill_source(
+    db: Session,
+    metric: str,
+    id_column,
+    workspace_column,
+    time_column,
+    task_column,
+    criteria: Tuple,
+    upper_id: int,
+    batch_size: int
+) -> int:
+    """依主鍵範圍分批讀取一個資料來源並累加統計，每批各自提交"""
+    processed = 0
+    last_id = 0
+    while last_id < upper_id:
+        columns = [id_column, workspace_column, time_column] + ([task_column] if task_column is not None else [])
+        rows = db.execute(
+            select(*columns)
+            .where(id_column > last_id, id_column <= upper_id, time_column.is_not(None), *criteria)
+            .order_by(id_column)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        activity = Counter((row[1], bucket_start(row[2])) for row in rows)
+        _increment(db, ActivityRollup, [
+            {"workspace_id": workspace_id, "bucket_start": hour, "metric": metric, "count": count}
+            for (workspace_id, hour), count in activity.items()
+        ])
+        if task_column is not None:
+            per_task = Counter((row[3], bucket_start(row[2])) for row in rows)
+            _increment(db, TaskCommentRollup, [
+                {"task_id": task_id, "bucket_start": hour, "count": count}
+                for (task_id, hour), count in per_task.items()
+            ])
+        db.commit()
+
+        processed += len(rows)
+        last_id = rows[-1][0]
+        logger.info(f"Backfilled {metric}: {processed} rows (up to id {last_id})")
+    return processed
+
+
+def backfill_rollups(db: Session, batch_size: int = 5000) -> int:
+    """
+    清空並由原始資料表重建所有活動統計
+
+    清空時記下各表目前的最大 id 並只重建至此，之後新增的資料由寫入路徑計數，避免重複累加
+
+    參數:
+        db: 資料庫會話
+        batch_size: 每批讀取的列數
+
+    回傳:
+        處理的資料列數
+    """
+    sources = (
+        (TASKS_CREATED, Task.id, Task.workspace_id, Task.created_at, None, ()),
+        (TASKS_CREATED, ArchivedTask.id, ArchivedTask.workspace_id, ArchivedTask.created_at, None, ()),
+        (TASKS_COMPLETED, Task.id, Task.workspace_id, Task.updated_at, None, (Task.status == TaskStatus.COMPLETED,)),
+        (TASKS_COMPLETED, ArchivedTask.id, ArchivedTask.workspace_id, ArchivedTask.updated_at, None, ()),
+        (COMMENTS_CREATED, Comment.id, Comment.workspace_id, Comment.created_at, Comment.task_id, ()),
+        (
+            COMMENTS_CREATED, ArchivedComment.id, ArchivedComment.workspace_id, ArchivedComment.created_at,
+            ArchivedComment.task_id, ()
+        ),
+    )
+
+    db.execute(delete(ActivityRollup))
+    db.execute(delete(TaskCommentRollup))
+    upper_ids = [db.execute(select(func.max(source[1]))).scalar() or 0 for source in sources]
+    db.commit()
+
+    processed = 0
+    for (metric, id_column, workspace_column, time_column, task_column, criteria), upper_id in zip(sources, upper_ids):
+        processed += _backfill_source(
+            db, metric, id_column, workspace_column, time_column, task_column, criteria, upper_id, batch_size
+        )
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由任務與留言資料重建活動統計")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批讀取的列數")
+    parser.add_argument("--shard", help="重建指定分片的統計（預設為主庫）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = open_shard_session(args.shard)
+    try:
+        total = backfill_rollups(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    logger.info(f"Done, {total} rows rolled up")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+已刪除任務清除作業
+
+任務刪除時僅標記 deleted_at，由此作業分批刪除其留言後再移除任務本身，
+避免一次刪除大量留言造成長時間鎖定。主庫與每個分片各自清除。
+
+執行方式（於 backend 目錄）:
+    python -m app.jobs.task_purger --batch-size 1000
+"""
+import argparse
+import asyncio
+import logging
+from typing import Optional, Tuple
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from ..core.database import open_shard_session, shard_engines
+from ..models import Comment, Task, TaskCommentRollup
+
+logger = logging.getLogger(__name__)
+
+# 有任務被刪除時喚醒背景清除迴圈（於迴圈啟動時建立，綁定當下的事件迴圈）
+_purge_requested: Optional[asyncio.Event] = None
+
+
+def request_purge():
+    """通知背景清除迴圈立即執行"""
+    if _purge_requested is not None:
+        _purge_requested.set()
+
+
+def purge_deleted_tasks(db: Session, batch_size: int = 1000) -> Tuple[int, int]:
+    """
+    分批刪除已軟刪除任務的留言，留言清空後刪除任務
+    
+    參數:
+        db: 資料庫會話
+        batch_size: 每批刪除的留言數量（每批各自提交）
+    
+    回傳:
+        (清除的任務數, 刪除的留言數)
+    """
+    purged_tasks = 0
+    deleted_comments = 0
+    
+    task_ids = db.execute(
+        select(Task.id).where(Task.deleted_at.is_not(None)).order_by(Task.deleted_at)
+    ).scalars().all()
+    
+    for task_id in task_ids:
+        while True:
+            comment_ids = db.execute(
+                select(Comment.id).where(Comment.task_id == task_id).limit(batch_size)
+            ).scalars().all()
+            if not comment_ids:
+                break
+            db.execute(delete(Comment).where(Comment.id.in_(comment_ids)))
+            db.commit()
+            deleted_comments += len(comment_ids)
+        
+        db.execute(delete(TaskCommentRollup).where(TaskCommentRollup.task_id == task_id))
+        db.execute(delete(Task).where(Task.id == task_id, Task.deleted_at.is_not(None)))
+        db.commit()
+        purged_tasks += 1
+        logger.info(f"Purged deleted task {task_id}")
+    
+    return purged_tasks, deleted_comments
+
+
+def _purge_once(batch_size: int) -> Tuple[int, int]:
+    purged_tasks = 0
+    deleted_comments = 0
+    for shard in [None, *shard_engines]:
+        db = open_shard_session(shard)
+        try:
+            tasks, comments = purge_deleted_tasks(db, batch_size=batch_size)
+        finally:
+            db.close()
+        purged_tasks += tasks
+        deleted_comments += comments
+    return purged_tasks, deleted_comments
+
+
+async def run_task_purger(interval: float, batch_size: int):
+    """背景清除迴圈：每 interval 秒或收到刪除通知時執行一次，直到被取消"""
+    global _purge_requested
+    _purge_requested = asyncio.Event()
+    while True:
+        try:
+            await asyncio.wait_for(_purge_requested.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        _purge_requested.clear()
+        
+        try:
+            # 同步資料庫操作移至執行緒，避免阻塞事件迴圈
+            await asyncio.to_thread(_purge_once, batch_size)
+        except Exception as e:
+            logger.error(f"Task purge failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清除已刪除任務及其留言")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批刪除的留言數量")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    tasks, comments = _purge_once(args.batch_size)
+    logger.info(f"Done, {tasks} tasks and {comments} comments purged")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 from ..core.database import Base
 from .user import User
+from .workspace import DEFAULT_WORKSPACE_ID, Workspace, WorkspaceMember
 from .task import Task, TaskStatus
 from .comment import Comment
+from .archive import ArchivedTask, ArchivedComment
+from .rollup import ActivityRollup, TaskCommentRollup
 
-__all__ = ["Base", "User", "Task", "TaskStatus", "Comment"]
\ No newline at end of file
+__all__ = ["Base", "User", "DEFAULT_WORKSPACE_ID", "Workspace", "WorkspaceMember", "Task", "TaskStatus",
+           "Comment", "ArchivedTask", "ArchivedComment", "ActivityRollup", "TaskCommentRollup"]
\ No newline at end of file
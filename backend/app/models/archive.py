@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from ..core.database import Base
+from .task import TaskStatus
+from .workspace import DEFAULT_WORKSPACE_ID
+
+
+class ArchivedTask(Base):
+    """已封存的任務（冷資料），欄位與 tasks 相同並保留原本的 id"""
+    __tablename__ = "tasks_archive"
+    __table_args__ = (
+        Index("ix_tasks_archive_workspace_created_at", "workspace_id", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    workspace_id = Column(
+        Integer, ForeignKey("workspaces.id"), nullable=False,
+        default=DEFAULT_WORKSPACE_ID, server_default=str(DEFAULT_WORKSPACE_ID)
+    )
+    title = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    status = Column(Enum(TaskStatus), nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_comment_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # 關聯
+    creator = relationship("User")
+    comments = relationship("ArchivedComment", back_populates="task", passive_deletes=True)
+
+
+class ArchivedComment(Base):
+    """已封存任務的留言，保留原本的 id"""
+    __tablename__ = "comments_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    workspace_id = Column(
+        Integer, ForeignKey("workspaces.id"), nullable=False,
+        default=DEFAULT_WORKSPACE_ID, server_default=str(DEFAULT_WORKSPACE_ID)
+    )
+    content = Column(Text, nullable=False)
+    task_id = Column(Integer, ForeignKey("tasks_archive.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    
+    # 關聯
+    task = relationship("ArchivedTask", back_populates="comments")
+    user = relationship("User")
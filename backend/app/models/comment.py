@@ -1,15 +1,24 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
+from .workspace import DEFAULT_WORKSPACE_ID
 
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_workspace_created_at", "workspace_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
+    # 與所屬任務相同（反正規化，讓工作區層級的留言查詢不需關聯任務）
+    workspace_id = Column(
+        Integer, ForeignKey("workspaces.id"), nullable=False,
+        default=DEFAULT_WORKSPACE_ID, server_default=str(DEFAULT_WORKSPACE_ID)
+    )
     content = Column(Text, nullable=False)
-    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
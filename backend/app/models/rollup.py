@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from ..core.database import Base
+
+
+class ActivityRollup(Base):
+    """每個工作區每小時的活動計數（任務建立、任務完成、留言建立），由寫入路徑遞增維護"""
+    __tablename__ = "activity_rollups"
+    
+    workspace_id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    metric = Column(String(32), primary_key=True)
+    count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class TaskCommentRollup(Base):
+    """每個任務每小時的留言數（不設外鍵，任務封存後仍保留統計，清除已刪除任務時一併移除）"""
+    __tablename__ = "task_comment_rollups"
+    
+    task_id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True, index=True)
+    count = Column(Integer, nullable=False, default=0, server_default="0")
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
+from .workspace import DEFAULT_WORKSPACE_ID
 import enum
 
 
@@ -12,8 +13,21 @@ class TaskStatus(str, enum.Enum):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # 封存作業依狀態與完成時間挑選任務
+        Index("ix_tasks_status_updated_at", "status", "updated_at"),
+        # 列表、篩選與統計皆限定於單一工作區
+        Index("ix_tasks_workspace_created_at", "workspace_id", "created_at"),
+        Index("ix_tasks_workspace_last_comment_at", "workspace_id", "last_comment_at"),
+        Index("ix_tasks_workspace_comment_count", "workspace_id", "comment_count"),
+        Index("ix_tasks_workspace_status", "workspace_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
+    workspace_id = Column(
+        Integer, ForeignKey("workspaces.id"), nullable=False,
+        default=DEFAULT_WORKSPACE_ID, server_default=str(DEFAULT_WORKSPACE_ID)
+    )
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     status = Column(Enum(TaskStatus), default=TaskStatus.IN_PROGRESS, nullable=False)
@@ -21,6 +35,17 @@ class Task(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    # 樂觀鎖版本號：每次編輯遞增，更新時帶入目前版本，不符代表已被他人修改
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    
+    # 留言統計（反正規化，由留言新增/刪除時原子性更新，避免列表查詢時 COUNT）
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_comment_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # 軟刪除時間：刪除時先隱藏任務，留言由背景清除作業分批移除
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    
     # 關聯
     creator = relationship("User", back_populates="tasks")
-    comments = relationship("Comment", back_populates="task", cascade="all, delete-orphan")
\ No newline at end of file
+    # passive_deletes：刪除任務時交由資料庫 ON DELETE CASCADE，不先載入所有留言
+    comments = relationship("Comment", back_populates="task", cascade="all, delete-orphan", passive_deletes=True)
\ No newline at end of file
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+# 預設工作區：既有資料與未指定工作區的請求皆屬於此工作區，所有使用者皆可存取
+DEFAULT_WORKSPACE_ID = 1
+
+
+class Workspace(Base):
+    """工作區：任務、留言、統計與即時留言房間的分區"""
+    __tablename__ = "workspaces"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    # 存放此工作區任務與留言的分片（settings.database_shard_urls 的名稱），空值表示主庫
+    shard = Column(String(64), nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class WorkspaceMember(Base):
+    """工作區成員（預設工作區不需加入即可存取）"""
+    __tablename__ = "workspace_members"
+    
+    workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -5,13 +5,14 @@ from sqlalchemy import exc
 from datetime import timedelta
 from pydantic import BaseModel
 
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db, mark_recent_write
 from ..core.security import verify_password, get_password_hash, create_access_token, create_refresh_token, verify_token
 from ..core.config import settings
+from ..core.profiling import ProfiledRoute, span
 from ..models import User
 from ..schemas import UserCreate, UserLogin, User as UserSchema, Token
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 security = HTTPBearer()
 
 
@@ -45,7 +46,7 @@ def authenticate_user(db: Session, email: str, password: str):
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """取得當前使用者"""
     credentials_exception = HTTPException(
@@ -54,36 +55,21 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = verify_token(credentials.credentials)
-        if payload is None:
-            raise credentials_exception
-        email: str = payload.get("sub")
-        if email is None:
+    with span("auth"):
+        try:
+            payload = verify_token(credentials.credentials)
+            if payload is None:
+                raise credentials_exception
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except Exception:
             raise credentials_exception
-    except Exception:
-        raise credentials_exception
-    
-    user = get_user_by_email(db, email=email)
-    if user is None:
-        raise credentials_exception
-    return user
-
-
-def get_current_user_from_websocket(token: str, db: Session):
-    """從WebSocket token取得當前使用者"""
-    try:
-        payload = verify_token(token)
-        if payload is None:
-            return None
-        email: str = payload.get("sub")
-        if email is None:
-            return None
         
         user = get_user_by_email(db, email=email)
+        if user is None:
+            raise credentials_exception
         return user
-    except Exception:
-        return None
 
 
 @router.post("/register", response_model=UserSchema)
@@ -97,9 +83,11 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
             detail="Email 已被註冊"
         )
     
-    # 建立新使用者
+    # 建立新使用者（標記為剛寫入，讓緊接著的登入後查詢讀取主庫）
     try:
-        return create_user(db=db, user=user)
+        db_user = create_user(db=db, user=user)
+        mark_recent_write(db_user.email)
+        return db_user
     except exc.IntegrityError:
         db.rollback()
         raise HTTPException(
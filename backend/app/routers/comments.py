@@ -1,63 +1,180 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from ..core.database import get_db
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.requests import HTTPConnection
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session, joinedload
+from typing import Dict, List, Literal, Optional
+from ..core.negotiation import NegotiatedResponse, normalize_users
+from ..core.profiling import ProfiledRoute
+from ..core.queries import list_comments
+from ..core.streaming import ExportFormat, export_response
+from ..core.workspaces import WorkspaceContext
+from ..jobs.rollups import record_comment_activity
 from .auth import get_current_user
-from ..models import Comment as CommentModel, Task as TaskModel, User as UserModel
+from .workspaces import get_current_workspace, get_workspace_db, get_workspace_read_db
+from ..models import Comment as CommentModel, Task as TaskModel, User as UserModel, ArchivedComment, ArchivedTask
 from ..schemas import Comment, CommentCreate, CommentList
 
-router = APIRouter(prefix="/tasks/{task_id}/comments", tags=["comments"])
+router = APIRouter(prefix="/tasks/{task_id}/comments", tags=["comments"], route_class=ProfiledRoute)
+# 跨任務的留言查詢
+batch_router = APIRouter(prefix="/comments", tags=["comments"], route_class=ProfiledRoute)
+
+# 一次批次查詢的任務數上限
+MAX_BATCH_TASKS = 100
+
+
+def increment_comment_stats(db: Session, workspace_id: int, task_id: int) -> bool:
+    """
+    新增留言時原子性遞增任務的留言數、更新最後留言時間並累加活動統計
+    
+    須在新增留言之前、同一交易內呼叫：先取得任務列的寫入鎖，
+    避免同時留言時留言外鍵檢查的共享鎖與任務更新互相死結。
+    任務已刪除或已封存時不更新並回傳 False，呼叫端不可新增留言。
+    """
+    updated = db.query(TaskModel).filter(
+        TaskModel.id == task_id,
+        TaskModel.workspace_id == workspace_id,
+        TaskModel.deleted_at.is_(None)
+    ).update(
+        {
+            TaskModel.comment_count: TaskModel.comment_count + 1,
+            TaskModel.last_comment_at: func.now(),
+            # 留言不視為任務內容更新，保留原本的 updated_at
+            TaskModel.updated_at: TaskModel.updated_at
+        },
+        synchronize_session=False
+    )
+    if not updated:
+        return False
+    record_comment_activity(db, workspace_id, {task_id: 1})
+    return True
+
+
+def decrement_comment_stats(db: Session, task_id: int):
+    """刪除留言後（已 flush）原子性遞減留言數並以剩餘留言重算最後留言時間"""
+    db.query(TaskModel).filter(TaskModel.id == task_id).update(
+        {
+            TaskModel.comment_count: case(
+                (TaskModel.comment_count > 0, TaskModel.comment_count - 1),
+                else_=0
+            ),
+            TaskModel.last_comment_at: select(func.max(CommentModel.created_at))
+                .where(CommentModel.task_id == task_id)
+                .scalar_subquery(),
+            TaskModel.updated_at: TaskModel.updated_at
+        },
+        synchronize_session=False
+    )
+
+
+def _find_active_task(db: Session, workspace_id: int, task_id: int):
+    return db.query(TaskModel.id)\
+        .filter(TaskModel.id == task_id, TaskModel.workspace_id == workspace_id, TaskModel.deleted_at.is_(None))\
+        .first()
+
+
+def _find_archived_task(db: Session, workspace_id: int, task_id: int):
+    return db.query(ArchivedTask.id)\
+        .filter(ArchivedTask.id == task_id, ArchivedTask.workspace_id == workspace_id)\
+        .first()
+
 
 @router.get("/", response_model=List[Comment])
 async def get_task_comments(
     task_id: int,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    shape: Literal["nested", "normalized"] = Query(
+        "nested", description="normalized 時留言者只在 users 中列出一次，留言以 user_id 對應"
+    ),
+    db: Session = Depends(get_workspace_read_db),
+    current_user: UserModel = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
 ):
-    """取得任務的所有留言"""
+    """取得任務的所有留言（已封存的任務會從封存表讀取）"""
     
-    # 驗證任務是否存在
-    task = db.query(TaskModel).filter(TaskModel.id == task_id).first()
+    # 驗證任務是否存在於目前工作區，找不到時改查封存表
+    archived = False
+    task = _find_active_task(db, workspace.id, task_id)
+    if not task:
+        task = _find_archived_task(db, workspace.id, task_id)
+        archived = True
     if not task:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="找不到任務"
         )
     
-    # 查詢留言（按建立時間排序）
-    comments = db.query(CommentModel)\
-        .filter(CommentModel.task_id == task_id)\
-        .order_by(CommentModel.created_at.asc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    # 查詢留言（按建立時間排序），以 Core 查詢直接組成回應資料
+    comments = list_comments(db, task_id, skip, limit, archived=archived)
     
+    if shape == "normalized":
+        items = [Comment.model_validate(comment).model_dump(mode="json") for comment in comments]
+        return NegotiatedResponse(normalize_users(items, "user", "comments"))
     return comments
 
+@router.get("/export")
+def export_task_comments(
+    task_id: int,
+    conn: HTTPConnection,
+    format: ExportFormat = Query("ndjson", description="匯出格式"),
+    created_from: Optional[datetime] = Query(None, description="留言時間起（含）"),
+    created_to: Optional[datetime] = Query(None, description="留言時間迄（不含）"),
+    db: Session = Depends(get_workspace_read_db),
+    current_user: UserModel = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
+):
+    """串流匯出任務的所有留言（NDJSON 或 CSV，已封存的任務會從封存表讀取）"""
+    
+    # 驗證任務是否存在於目前工作區，找不到時改查封存表
+    model = CommentModel
+    task = _find_active_task(db, workspace.id, task_id)
+    if not task:
+        task = _find_archived_task(db, workspace.id, task_id)
+        model = ArchivedComment
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="找不到任務"
+        )
+    
+    query = select(
+        model.id, model.task_id, model.user_id, UserModel.email, model.content, model.created_at
+    ).join(UserModel, UserModel.id == model.user_id).where(model.task_id == task_id)
+    
+    if created_from:
+        query = query.where(model.created_at >= created_from)
+    if created_to:
+        query = query.where(model.created_at < created_to)
+    
+    fields = ("id", "task_id", "user_id", "user_email", "content", "created_at")
+    return export_response(
+        conn, query.order_by(model.created_at.asc(), model.id.asc()), fields, format,
+        f"task-{task_id}-comments", shard=workspace.shard
+    )
+
 @router.post("/", response_model=Comment)
 async def create_comment(
     task_id: int,
     comment: CommentCreate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: Session = Depends(get_workspace_db),
+    current_user: UserModel = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
 ):
     """建立新留言（REST API，非即時）"""
     
-    # 驗證任務是否存在
-    task = db.query(TaskModel).filter(TaskModel.id == task_id).first()
-    if not task:
+    # 更新任務的留言統計，同時確認任務存在於目前工作區且未刪除或封存
+    if not increment_comment_stats(db, workspace.id, task_id):
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="找不到任務"
         )
-    
-    # 建立留言
     db_comment = CommentModel(
         content=comment.content,
         task_id=task_id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        workspace_id=workspace.id
     )
     db.add(db_comment)
     db.commit()
@@ -69,14 +186,19 @@ async def create_comment(
 async def delete_comment(
     task_id: int,
     comment_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: Session = Depends(get_workspace_db),
+    current_user: UserModel = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
 ):
     """刪除留言（只能刪除自己的留言）"""
     
     # 查找留言
     comment = db.query(CommentModel)\
-        .filter(CommentModel.id == comment_id, CommentModel.task_id == task_id)\
+        .filter(
+            CommentModel.id == comment_id,
+            CommentModel.task_id == task_id,
+            CommentModel.workspace_id == workspace.id
+        )\
         .first()
     
     if not comment:
@@ -92,8 +214,55 @@ async def delete_comment(
             detail="您只能刪除自己的留言"
         )
     
-    # 刪除留言
+    # 刪除留言並更新任務的留言統計
     db.delete(comment)
+    db.flush()
+    decrement_comment_stats(db, task_id)
     db.commit()
     
-    return {"message": "留言刪除成功"}
\ No newline at end of file
+    return {"message": "留言刪除成功"}
+
+@batch_router.get("", response_model=Dict[int, List[Comment]])
+async def get_latest_comments(
+    task_ids: str = Query(..., description="以逗號分隔的任務 id"),
+    per_task: int = Query(3, ge=1, le=50, description="每個任務返回的最新留言數"),
+    db: Session = Depends(get_workspace_read_db),
+    current_user: UserModel = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
+):
+    """批次取得多個任務的最新留言（單一視窗函數查詢，依任務分組並按建立時間排序）"""
+    try:
+        ids = list(dict.fromkeys(int(task_id) for task_id in task_ids.split(",") if task_id.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="task_ids 須為以逗號分隔的整數"
+        )
+    if not ids or len(ids) > MAX_BATCH_TASKS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"task_ids 須包含 1 到 {MAX_BATCH_TASKS} 個任務"
+        )
+    
+    # 依任務分組由新到舊編號，只取每組前 N 筆；已刪除或其他工作區的任務不返回留言
+    ranked = select(
+        CommentModel.id,
+        func.row_number().over(
+            partition_by=CommentModel.task_id,
+            order_by=(CommentModel.created_at.desc(), CommentModel.id.desc())
+        ).label("position")
+    ).join(TaskModel, TaskModel.id == CommentModel.task_id)\
+        .where(CommentModel.task_id.in_(ids), TaskModel.workspace_id == workspace.id, TaskModel.deleted_at.is_(None))\
+        .subquery()
+    
+    comments = db.query(CommentModel)\
+        .options(joinedload(CommentModel.user))\
+        .join(ranked, ranked.c.id == CommentModel.id)\
+        .filter(ranked.c.position <= per_task)\
+        .order_by(CommentModel.task_id, CommentModel.created_at.asc(), CommentModel.id.asc())\
+        .all()
+    
+    result: Dict[int, List[CommentModel]] = {task_id: [] for task_id in ids}
+    for comment in comments:
+        result[comment.task_id].append(comment)
+    return result
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import HTMLResponse
+
+from ..core.profiling import get_profile
+from ..models import User
+from .auth import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/profiles/{profile_id}", response_class=HTMLResponse)
+async def download_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """下載單一請求的取樣剖析結果（HTML，production 只能下載自己請求的剖析）"""
+    html = get_profile(profile_id, current_user.email)
+    if html is None:
+        raise HTTPException(status_code=404, detail="找不到剖析結果")
+    return HTMLResponse(
+        html,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.html"'}
+    )
@@ -1,87 +1,251 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.requests import HTTPConnection
+from sqlalchemy import func, literal, select, union_all, update
 from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from ..core.database import get_db
-from ..models import Task, User
+from ..core.config import settings
+from ..core.database import open_shard_session
+from ..core.negotiation import NegotiatedResponse, normalize_users
+from ..core.profiling import ProfiledRoute
+from ..core.queries import list_tasks
+from ..core.streaming import ExportFormat, NDJSONUploadResponse, export_response
+from ..core.workspaces import WorkspaceContext
+from ..models import ActivityRollup, ArchivedTask, Task, TaskCommentRollup, User
 from ..models.task import TaskStatus
 from ..schemas import TaskCreate, TaskUpdate, Task as TaskSchema, TaskWithCreator
+from ..jobs.importer import BulkImporter, ImportFormat, RecordParser, import_stream
+from ..jobs.rollups import (
+    BUCKET_SIZES, COMMENTS_CREATED, METRICS, TASKS_COMPLETED, TASKS_CREATED,
+    bucket_start, current_hour, record_activity, to_local
+)
+from ..jobs.task_purger import request_purge
+from ..websocket.handshake import remember_task_created, remember_task_deleted
+from ..websocket.manager import manager
 from .auth import get_current_user
+from .workspaces import get_current_workspace, get_workspace_db, get_workspace_read_db
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
+
+# 時間序列查詢的區間數上限
+MAX_TIMESERIES_BUCKETS = 1000
+
+
+def _read_tasks_including_archive(
+    db: Session,
+    workspace_id: int,
+    status: Optional[TaskStatus],
+    sort_by: str,
+    skip: int,
+    limit: int
+) -> List[dict]:
+    """合併查詢使用中與已封存的任務（UNION ALL 後統一排序與分頁）"""
+    def task_columns(model, archived: bool):
+        query = select(
+            model.id, model.title, model.description, model.status, model.created_by,
+            model.created_at, model.updated_at, model.version, model.comment_count, model.last_comment_at,
+            literal(archived).label("archived")
+        ).where(model.workspace_id == workspace_id)
+        if status:
+            query = query.where(model.status == status)
+        return query
+    
+    combined = union_all(
+        task_columns(Task, False).where(Task.deleted_at.is_(None)),
+        task_columns(ArchivedTask, True)
+    ).subquery()
+    
+    order_by = [combined.c.created_at.desc()]
+    if sort_by != "created_at":
+        order_by.insert(0, combined.c[sort_by].desc())
+    
+    rows = db.execute(
+        select(combined, User.email.label("creator_email"))
+        .join(User, User.id == combined.c.created_by)
+        .order_by(*order_by)
+        .offset(skip)
+        .limit(limit)
+    ).all()
+    
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "description": row.description,
+            "status": row.status,
+            "created_by": row.created_by,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "version": row.version,
+            "comment_count": row.comment_count,
+            "last_comment_at": row.last_comment_at,
+            "archived": bool(row.archived),
+            "creator": {
+                "id": row.created_by,
+                "email": row.creator_email
+            }
+        }
+        for row in rows
+    ]
 
 
 @router.post("/", response_model=TaskSchema)
 async def create_task(
     task: TaskCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_db)
 ):
     """建立新任務"""
     db_task = Task(
         title=task.title,
         description=task.description,
         created_by=current_user.id,
+        workspace_id=workspace.id,
         status=TaskStatus.IN_PROGRESS
     )
     db.add(db_task)
+    db.flush()
+    record_activity(db, workspace.id, TASKS_CREATED)
     db.commit()
     db.refresh(db_task)
+    remember_task_created(workspace.id, db_task.id)
     return db_task
 
 
+def _import_response(
+    request: Request,
+    kind: Literal["tasks", "comments"],
+    format: ImportFormat,
+    resume_from: int,
+    user_id: int,
+    workspace: WorkspaceContext
+) -> NDJSONUploadResponse:
+    """邊讀取請求本體邊匯入，以 NDJSON 逐批回報錯誤列與進度"""
+    async def handler(chunks):
+        # 匯入在端點返回後才執行，需自行開啟與關閉會話
+        db = open_shard_session(workspace.shard)
+        db.info["connection"] = request
+        try:
+            importer = BulkImporter(kind, user_id, settings.import_batch_size, resume_from, workspace.id)
+            async for event in import_stream(chunks, RecordParser(format), importer, db):
+                yield event
+        finally:
+            db.close()
+    
+    return NDJSONUploadResponse(handler)
+
+
+@router.post("/import")
+async def import_tasks(
+    request: Request,
+    format: ImportFormat = Query("ndjson", description="請求本體格式"),
+    resume_from: int = Query(0, ge=0, description="略過已處理的資料列數（中斷後續傳）"),
+    current_user: User = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
+):
+    """大量匯入任務（本體為 NDJSON 或 CSV，欄位同 TaskCreate）"""
+    return _import_response(request, "tasks", format, resume_from, current_user.id, workspace)
+
+
+@router.post("/import/comments")
+async def import_comments(
+    request: Request,
+    format: ImportFormat = Query("ndjson", description="請求本體格式"),
+    resume_from: int = Query(0, ge=0, description="略過已處理的資料列數（中斷後續傳）"),
+    current_user: User = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
+):
+    """大量匯入留言（本體為 NDJSON 或 CSV，欄位為 task_id 與 content）"""
+    return _import_response(request, "comments", format, resume_from, current_user.id, workspace)
+
+
 @router.get("/", response_model=List[TaskWithCreator])
 async def read_tasks(
     status: Optional[TaskStatus] = Query(None, description="按狀態篩選任務"),
+    sort_by: Literal["created_at", "last_comment_at", "comment_count"] = Query(
+        "created_at", description="排序欄位（皆為倒序）"
+    ),
     skip: int = Query(0, ge=0, description="跳過的項目數"),
     limit: int = Query(100, ge=1, le=100, description="返回的項目數"),
+    include_archived: bool = Query(False, description="是否包含已封存的任務"),
+    shape: Literal["nested", "normalized"] = Query(
+        "nested", description="normalized 時建立者只在 users 中列出一次，任務以 created_by 對應"
+    ),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_read_db)
 ):
-    """取得任務列表（全體共用）"""
-    query = db.query(Task).options(joinedload(Task.creator))
+    """取得目前工作區的任務列表"""
+    if include_archived:
+        result = _read_tasks_including_archive(db, workspace.id, status, sort_by, skip, limit)
+        if shape == "normalized":
+            return NegotiatedResponse(jsonable_encoder(normalize_users(result, "creator", "tasks")))
+        return result
     
-    # 按狀態篩選
-    if status:
-        query = query.filter(Task.status == status)
-    
-    # 按建立時間倒序排列
-    query = query.order_by(Task.created_at.desc())
-    
-    tasks = query.offset(skip).limit(limit).all()
-    
-    # 格式化傳回資料
-    result = []
-    for task in tasks:
-        task_dict = {
-            "id": task.id,
-            "title": task.title,
-            "description": task.description,
-            "status": task.status,
-            "created_by": task.created_by,
-            "created_at": task.created_at,
-            "updated_at": task.updated_at,
-            "creator": {
-                "id": task.creator.id,
-                "email": task.creator.email
-            }
-        }
-        result.append(task_dict)
+    # 以 Core 查詢直接組成回應資料，不建立 ORM 物件
+    result = list_tasks(db, workspace.id, status, sort_by, skip, limit)
     
+    if shape == "normalized":
+        return NegotiatedResponse(jsonable_encoder(normalize_users(result, "creator", "tasks")))
     return result
 
 
+@router.get("/export")
+def export_tasks(
+    conn: HTTPConnection,
+    format: ExportFormat = Query("ndjson", description="匯出格式"),
+    status: Optional[TaskStatus] = Query(None, description="按狀態篩選任務"),
+    created_from: Optional[datetime] = Query(None, description="建立時間起（含）"),
+    created_to: Optional[datetime] = Query(None, description="建立時間迄（不含）"),
+    current_user: User = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace)
+):
+    """串流匯出目前工作區的任務（NDJSON 或 CSV），以伺服器端游標分批讀取"""
+    query = select(
+        Task.id, Task.title, Task.description, Task.status, Task.created_by,
+        User.email, Task.created_at, Task.updated_at, Task.comment_count, Task.last_comment_at
+    ).join(User, User.id == Task.created_by).where(Task.workspace_id == workspace.id, Task.deleted_at.is_(None))
+    
+    if status:
+        query = query.where(Task.status == status)
+    if created_from:
+        query = query.where(Task.created_at >= created_from)
+    if created_to:
+        query = query.where(Task.created_at < created_to)
+    
+    fields = (
+        "id", "title", "description", "status", "created_by",
+        "creator_email", "created_at", "updated_at", "comment_count", "last_comment_at"
+    )
+    return export_response(conn, query.order_by(Task.id), fields, format, "tasks", shard=workspace.shard)
+
+
 @router.get("/{task_id}", response_model=TaskWithCreator)
 async def read_task(
     task_id: int,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_read_db)
 ):
-    """取得單個任務詳情"""
-    task = db.query(Task).options(joinedload(Task.creator)).filter(Task.id == task_id).first()
+    """取得單個任務詳情（已封存的任務會從封存表讀取）"""
+    task = db.query(Task).options(joinedload(Task.creator))\
+        .filter(Task.id == task_id, Task.workspace_id == workspace.id, Task.deleted_at.is_(None))\
+        .first()
+    archived = False
+    if task is None:
+        task = db.query(ArchivedTask).options(joinedload(ArchivedTask.creator))\
+            .filter(ArchivedTask.id == task_id, ArchivedTask.workspace_id == workspace.id)\
+            .first()
+        archived = True
     if task is None:
         raise HTTPException(status_code=404, detail="找不到任務")
     
+    # 版本號作為 ETag，編輯時以 If-Match 帶回
+    response.headers["ETag"] = f'"{task.version}"'
     return {
         "id": task.id,
         "title": task.title,
@@ -90,6 +254,10 @@ async def read_task(
         "created_by": task.created_by,
         "created_at": task.created_at,
         "updated_at": task.updated_at,
+        "version": task.version,
+        "comment_count": task.comment_count,
+        "last_comment_at": task.last_comment_at,
+        "archived": archived,
         "creator": {
             "id": task.creator.id,
             "email": task.creator.email
@@ -97,37 +265,113 @@ async def read_task(
     }
 
 
+@router.get("/{task_id}/presence")
+async def read_task_presence(
+    task_id: int,
+    current_user: User = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_read_db)
+):
+    """取得任務留言房間的在線使用者"""
+    task = db.query(Task.id)\
+        .filter(Task.id == task_id, Task.workspace_id == workspace.id, Task.deleted_at.is_(None))\
+        .first()
+    if task is None:
+        raise HTTPException(status_code=404, detail="找不到任務")
+    
+    room = (workspace.id, task_id)
+    return {
+        "task_id": task_id,
+        "users": manager.get_task_presence(room),
+        "connections": manager.get_task_connection_count(room)
+    }
+
+
+def _parse_if_match(value: Optional[str]) -> Optional[int]:
+    """解析 If-Match 標頭中的版本號（接受 "3"、W/"3" 或 3，* 表示不檢查）"""
+    if value is None or value.strip() == "*":
+        return None
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的 If-Match 標頭")
+
+
 @router.put("/{task_id}", response_model=TaskSchema)
 async def update_task(
     task_id: int,
     task_update: TaskUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="編輯時的任務版本（ETag）"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_db)
 ):
-    """更新任務"""
-    task = db.query(Task).filter(Task.id == task_id).first()
+    """更新任務（帶入版本時以單一條件式 UPDATE 同時檢查版本並寫入，版本不符回傳 409）"""
+    update_data = task_update.dict(exclude_unset=True)
+    expected_version = update_data.pop("version", None)
+    header_version = _parse_if_match(if_match)
+    if header_version is not None:
+        expected_version = header_version
+    
+    active = [Task.id == task_id, Task.workspace_id == workspace.id, Task.deleted_at.is_(None)]
+    conditions = list(active)
+    if expected_version is not None:
+        conditions.append(Task.version == expected_version)
+    
+    # 標記為完成時先鎖定任務列取得原狀態，只在狀態實際改變時計入完成統計
+    completing = False
+    if update_data.get("status") == TaskStatus.COMPLETED:
+        previous_status = db.execute(
+            select(Task.status).where(*conditions).with_for_update()
+        ).scalar()
+        completing = previous_status is not None and previous_status != TaskStatus.COMPLETED
+    
+    if update_data:
+        statement = update(Task).where(*conditions)\
+            .values(**update_data, version=Task.version + 1)\
+            .execution_options(synchronize_session=False)
+        if db.get_bind().dialect.update_returning:
+            # 支援 RETURNING 時，更新與取回新資料只需一次往返
+            task = db.execute(statement.returning(Task)).scalars().first()
+        else:
+            updated = db.execute(statement).rowcount
+            task = db.query(Task).filter(Task.id == task_id).first() if updated else None
+    else:
+        task = db.query(Task).filter(*conditions).first()
+    
     if task is None:
-        raise HTTPException(status_code=404, detail="找不到任務")
+        db.rollback()
+        # 區分任務不存在與版本衝突
+        exists = db.query(Task.id).filter(*active).first()
+        if exists is None:
+            raise HTTPException(status_code=404, detail="找不到任務")
+        raise HTTPException(status_code=409, detail="任務已被其他人修改，請重新載入後再試")
     
-    # 更新字段
-    update_data = task_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(task, field, value)
+    if completing:
+        record_activity(db, workspace.id, TASKS_COMPLETED)
     
+    # 提交前轉為回應資料，避免提交後屬性過期而再次查詢
+    result = TaskSchema.model_validate(task)
     db.commit()
-    db.refresh(task)
-    return task
+    response.headers["ETag"] = f'"{result.version}"'
+    return result
 
 
 @router.get("/stats/overview")
 async def get_task_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_read_db)
 ):
-    """取得任務統計資訊"""
-    total = db.query(Task).count()
-    in_progress = db.query(Task).filter(Task.status == TaskStatus.IN_PROGRESS).count()
-    completed = db.query(Task).filter(Task.status == TaskStatus.COMPLETED).count()
+    """取得目前工作區的任務統計資訊"""
+    active = db.query(Task).filter(Task.workspace_id == workspace.id, Task.deleted_at.is_(None))
+    total = active.count()
+    in_progress = active.filter(Task.status == TaskStatus.IN_PROGRESS).count()
+    completed = active.filter(Task.status == TaskStatus.COMPLETED).count()
     
     return {
         "total": total,
@@ -136,17 +380,96 @@ async def get_task_stats(
     }
 
 
+@router.get("/stats/timeseries")
+async def get_activity_timeseries(
+    bucket: Literal["hour", "day", "week"] = Query("day", description="區間大小"),
+    start: Optional[datetime] = Query(None, description="起始時間（含，預設為結束前 30 個區間）"),
+    end: Optional[datetime] = Query(None, description="結束時間（不含，預設為現在）"),
+    task_id: Optional[int] = Query(None, description="指定時只返回該任務的留言數"),
+    current_user: User = Depends(get_current_user),
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_read_db)
+):
+    """取得活動時間序列（任務建立、完成與留言數），只讀取每小時彙總表"""
+    size = BUCKET_SIZES[bucket]
+    if end is None:
+        end = current_hour() + timedelta(hours=1)
+    end = to_local(end)
+    start = bucket_start(start if start is not None else end - size * 30, bucket)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="起始時間須早於結束時間")
+    if (end - start) / size > MAX_TIMESERIES_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"區間數不能超過 {MAX_TIMESERIES_BUCKETS}")
+    
+    if task_id is not None:
+        # 任務彙總以任務 id 為鍵，先確認任務（含已封存）屬於目前工作區
+        task = db.query(Task.id).filter(Task.id == task_id, Task.workspace_id == workspace.id).first()
+        if task is None:
+            task = db.query(ArchivedTask.id)\
+                .filter(ArchivedTask.id == task_id, ArchivedTask.workspace_id == workspace.id)\
+                .first()
+        if task is None:
+            raise HTTPException(status_code=404, detail="找不到任務")
+        metrics = (COMMENTS_CREATED,)
+        rows = db.execute(
+            select(literal(COMMENTS_CREATED), TaskCommentRollup.bucket_start, TaskCommentRollup.count)
+            .where(
+                TaskCommentRollup.task_id == task_id,
+                TaskCommentRollup.bucket_start >= start,
+                TaskCommentRollup.bucket_start < end
+            )
+        ).all()
+    else:
+        metrics = METRICS
+        rows = db.execute(
+            select(ActivityRollup.metric, ActivityRollup.bucket_start, ActivityRollup.count)
+            .where(
+                ActivityRollup.workspace_id == workspace.id,
+                ActivityRollup.bucket_start >= start,
+                ActivityRollup.bucket_start < end
+            )
+        ).all()
+    
+    # 補齊沒有活動的區間，再將每小時的計數加總到所屬區間
+    buckets = []
+    current = start
+    while current < end:
+        buckets.append(current)
+        current += size
+    series = {metric: dict.fromkeys(buckets, 0) for metric in metrics}
+    for metric, hour, count in rows:
+        if metric in series:
+            series[metric][bucket_start(hour, bucket)] += count
+    
+    return {
+        "bucket": bucket,
+        "start": start,
+        "end": end,
+        "task_id": task_id,
+        "series": {
+            metric: [{"bucket_start": key, "count": count} for key, count in counts.items()]
+            for metric, counts in series.items()
+        }
+    }
+
+
 @router.delete("/{task_id}")
 async def delete_task(
     task_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    db: Session = Depends(get_workspace_db)
 ):
-    """刪除任務"""
-    task = db.query(Task).filter(Task.id == task_id).first()
-    if task is None:
+    """刪除任務（先軟刪除立即隱藏，留言由背景作業分批清除）"""
+    deleted = db.query(Task)\
+        .filter(Task.id == task_id, Task.workspace_id == workspace.id, Task.deleted_at.is_(None))\
+        .update({Task.deleted_at: func.now()}, synchronize_session=False)
+    if not deleted:
         raise HTTPException(status_code=404, detail="找不到任務")
-    
-    db.delete(task)
     db.commit()
+    remember_task_deleted(workspace.id, task_id)
+    
+    # 通知並關閉任務的留言房間，再喚醒背景清除作業
+    await manager.close_task_room((workspace.id, task_id))
+    request_purge()
     return {"message": "任務刪除成功"}
\ No newline at end of file
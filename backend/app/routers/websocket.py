@@ -1,112 +1,197 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Response, status
 from sqlalchemy.orm import Session
+from typing import Optional
+from ..websocket.handshake import admission, remember_task_deleted, resolve_user, resolve_user_workspace, task_is_open
 from ..websocket.manager import manager
-from ..core.database import get_db
-from .auth import get_current_user_from_websocket
-from ..models import Comment as CommentModel, User as UserModel, Task as TaskModel
-from ..schemas import CommentCreate, Comment
-import json
+from ..websocket.protocol import JSON_PROTOCOL, MessageDecodeError, decode_message, select_protocol
+from ..core.config import settings
+from ..core.database import get_db, open_shard_session
+from ..core.security import verify_token
+from ..core.workspaces import SHARD_HEADER, WORKSPACE_QUERY_PARAM, serves_shard
+from .comments import increment_comment_stats
+from ..models import DEFAULT_WORKSPACE_ID, Comment as CommentModel
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+async def _reject(
+    websocket: WebSocket,
+    status_code: int,
+    close_code: int,
+    retry_after: Optional[float] = None,
+    shard: Optional[str] = None
+):
+    """
+    在升級前拒絕連線，不完成 WebSocket 握手
+    
+    伺服器支援 WebSocket Denial Response 時回傳對應的 HTTP 狀態碼（可附 Retry-After 與 X-Workspace-Shard），
+    否則以關閉代碼拒絕（升級請求會收到 403）
+    """
+    if "websocket.http.response" in websocket.scope.get("extensions", {}):
+        headers = {}
+        if retry_after:
+            headers["Retry-After"] = str(math.ceil(retry_after))
+        if shard:
+            headers[SHARD_HEADER] = shard
+        await websocket.send_denial_response(Response(status_code=status_code, headers=headers or None))
+    else:
+        await websocket.close(code=close_code)
+
+
 @router.websocket("/ws/tasks/{task_id}")
 async def websocket_endpoint(
     websocket: WebSocket, 
     task_id: int,
     db: Session = Depends(get_db)
 ):
-    """WebSocket端點 - 任務留言即時通訊"""
+    """WebSocket端點 - 任務留言即時通訊（以 workspace_id 參數指定工作區，未指定時為預設工作區）"""
     
-    # 先接受連接，再進行認證
-    await websocket.accept()
+    # 優雅關閉期間拒絕新連線，讓客戶端改連其他實例
+    if manager.draining:
+        await _reject(
+            websocket, status.HTTP_503_SERVICE_UNAVAILABLE, status.WS_1013_TRY_AGAIN_LATER,
+            retry_after=settings.ws_reconnect_backoff_max_ms / 1000
+        )
+        return
     
-    # WebSocket認證 - 從query參數獲取token
+    # 連線許可：限制每個 worker 的新連線速率與同時連線數，重連風暴時於升級前退回
+    retry_after = admission.try_admit(
+        manager.get_all_connections_count(), settings.ws_max_connections_per_worker
+    )
+    if retry_after is not None:
+        await _reject(
+            websocket, status.HTTP_503_SERVICE_UNAVAILABLE, status.WS_1013_TRY_AGAIN_LATER,
+            retry_after=retry_after
+        )
+        return
+    
+    # 在接受連線前驗證 token、工作區與任務（皆有快取，重新連線通常不需查詢資料庫）
     try:
-        # 從query參數獲取token
-        token = None
-        query_params = dict(websocket.query_params)
-        if "token" in query_params:
-            token = query_params["token"]
-        
-        if not token:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        token = websocket.query_params.get("token")
+        payload = verify_token(token) if token else None
+        email = payload.get("sub") if payload else None
+        current_user = resolve_user(db, email) if email else None
+        if not current_user:
+            await _reject(websocket, status.HTTP_403_FORBIDDEN, status.WS_1008_POLICY_VIOLATION)
             return
         
-        # 驗證使用者
-        current_user = get_current_user_from_websocket(token, db)
-        if not current_user:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        workspace_id = websocket.query_params.get(WORKSPACE_QUERY_PARAM)
+        workspace_id = int(workspace_id) if workspace_id else DEFAULT_WORKSPACE_ID
+        workspace = resolve_user_workspace(db, workspace_id, current_user.id)
+        if workspace is None:
+            await _reject(websocket, status.HTTP_404_NOT_FOUND, status.WS_1003_UNSUPPORTED_DATA)
+            return
+        if not serves_shard(workspace.shard):
+            await _reject(
+                websocket, status.HTTP_421_MISDIRECTED_REQUEST, status.WS_1008_POLICY_VIOLATION,
+                shard=workspace.shard_name
+            )
             return
         
-        # 驗證任務是否存在
-        task = db.query(TaskModel).filter(TaskModel.id == task_id).first()
-        if not task:
-            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+        # 任務與留言存放於工作區所在的分片
+        if workspace.shard is not None:
+            db.close()
+            db = open_shard_session(workspace.shard)
+        if not task_is_open(db, workspace.id, task_id):
+            await _reject(websocket, status.HTTP_404_NOT_FOUND, status.WS_1003_UNSUPPORTED_DATA)
             return
         
     except Exception as e:
         logger.error(f"WebSocket authentication failed: {e}")
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        await _reject(websocket, status.HTTP_403_FORBIDDEN, status.WS_1008_POLICY_VIOLATION)
         return
+    finally:
+        # 握手期間不持有資料庫連線，留言時再重新取得
+        db.close()
+    
+    room = (workspace.id, task_id)
+    
+    # 協商訊息子協定（客戶端未指定時使用 JSON 文字訊框）
+    subprotocol = select_protocol(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=subprotocol)
     
     # 使用管理器的connect方法建立連線
-    await manager.connect(websocket, task_id, current_user.id, current_user.email)
+    await manager.connect(
+        websocket, room, current_user.id, current_user.email,
+        protocol=subprotocol or JSON_PROTOCOL
+    )
     
     try:
         while True:
-            # 接收客戶端訊息
-            data = await websocket.receive_text()
+            # 接收客戶端訊息（文字或二進位訊框）
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+            # 任何訊息都代表連線仍存活
+            manager.touch(websocket)
             
             try:
-                message_data = json.loads(data)
+                message_data = decode_message(frame)
                 message_type = message_data.get("type")
                 
-                if message_type == "comment":
+                if message_type == "pong":
+                    # 心跳回應，僅需更新存活時間
+                    continue
+                
+                elif message_type == "ping":
+                    # 客戶端主動探測
+                    await manager.send_message(websocket, {"type": "pong"})
+                    continue
+                
+                elif message_type == "comment":
                     # 處理新留言
                     content = message_data.get("content", "").strip()
                     
                     if not content:
-                        await websocket.send_text(json.dumps({
+                        await manager.send_message(websocket, {
                             "type": "error",
                             "message": "留言內容不能為空"
-                        }, ensure_ascii=False))
+                        })
                         continue
                     
-                    # 建立留言記錄
-                    comment = CommentModel(
-                        content=content,
-                        task_id=task_id,
-                        user_id=current_user.id
-                    )
-                    db.add(comment)
-                    db.commit()
-                    db.refresh(comment)
-                    
-                    # 取得完整的留言資訊（包含使用者資訊）
-                    comment_with_user = db.query(CommentModel)\
-                        .filter(CommentModel.id == comment.id)\
-                        .first()
-                    
-                    # 構建廣播訊息
-                    broadcast_message = {
-                        "type": "new_comment",
-                        "comment": {
-                            "id": comment_with_user.id,
-                            "content": comment_with_user.content,
-                            "task_id": comment_with_user.task_id,
-                            "user_id": comment_with_user.user_id,
-                            "created_at": comment_with_user.created_at.isoformat(),
-                            "user": {
-                                "id": comment_with_user.user.id,
-                                "email": comment_with_user.user.email
+                    # 建立留言記錄（優雅關閉時會等待寫入與廣播完成）
+                    with manager.track_write():
+                        # 任務可能已在連線期間被刪除或由封存作業移出，此時不寫入留言並關閉房間
+                        if not increment_comment_stats(db, workspace.id, task_id):
+                            db.rollback()
+                            remember_task_deleted(workspace.id, task_id)
+                            await manager.close_task_room(room)
+                            continue
+                        comment = CommentModel(
+                            content=content,
+                            task_id=task_id,
+                            user_id=current_user.id,
+                            workspace_id=workspace.id
+                        )
+                        db.add(comment)
+                        db.commit()
+                        db.refresh(comment)
+                        
+                        # 取得完整的留言資訊（包含使用者資訊）
+                        comment_with_user = db.query(CommentModel)\
+                            .filter(CommentModel.id == comment.id)\
+                            .first()
+                        
+                        # 構建廣播訊息
+                        broadcast_message = {
+                            "type": "new_comment",
+                            "comment": {
+                                "id": comment_with_user.id,
+                                "content": comment_with_user.content,
+                                "task_id": comment_with_user.task_id,
+                                "user_id": comment_with_user.user_id,
+                                "created_at": comment_with_user.created_at.isoformat(),
+                                "user": {
+                                    "id": comment_with_user.user.id,
+                                    "email": comment_with_user.user.email
+                                }
                             }
                         }
-                    }
-                    
-                    # 向任務房間廣播新留言
-                    await manager.broadcast_to_task(task_id, broadcast_message)
+                        
+                        # 向任務房間廣播新留言
+                        await manager.broadcast_to_task(room, broadcast_message)
                     
                 elif message_type == "typing":
                     # 處理打字狀態
@@ -118,34 +203,36 @@ async def websocket_endpoint(
                     }
                     
                     await manager.broadcast_to_task(
-                        task_id, 
+                        room, 
                         typing_message, 
                         exclude_websocket=websocket
                     )
                     
                 else:
                     # 未知訊息類型
-                    await websocket.send_text(json.dumps({
+                    await manager.send_message(websocket, {
                         "type": "error", 
                         "message": f"未知的訊息類型: {message_type}"
-                    }, ensure_ascii=False))
+                    })
                     
-            except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({
+            except MessageDecodeError:
+                await manager.send_message(websocket, {
                     "type": "error",
-                    "message": "無效的JSON格式"
-                }, ensure_ascii=False))
+                    "message": "無效的訊息格式"
+                })
                 
             except Exception as e:
                 logger.error(f"Error processing message: {e}")
-                await websocket.send_text(json.dumps({
+                await manager.send_message(websocket, {
                     "type": "error",
                     "message": "處理訊息時發生錯誤"
-                }, ensure_ascii=False))
+                })
                 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
         logger.info(f"User {current_user.id} disconnected from task {task_id}")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        manager.disconnect(websocket)
\ No newline at end of file
+        manager.disconnect(websocket)
+    finally:
+        db.close()
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+工作區：列表、建立、成員與統計，以及依工作區路由資料庫會話的依賴項
+
+請求以 X-Workspace-Id 標頭或 workspace_id 參數指定工作區，未指定時為預設工作區。
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.requests import HTTPConnection
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+from typing import List
+
+from ..core.database import get_db, get_read_db, open_shard_session, open_workspace_read_session, shard_engines
+from ..core.profiling import ProfiledRoute
+from ..core.workspaces import (
+    SHARD_HEADER, WORKSPACE_HEADER, WORKSPACE_QUERY_PARAM, WorkspaceContext,
+    copy_to_shard, resolve_workspace, serves_shard
+)
+from ..models import DEFAULT_WORKSPACE_ID, Task, User, Workspace, WorkspaceMember
+from ..models.task import TaskStatus
+from ..schemas import Workspace as WorkspaceSchema, WorkspaceCreate, WorkspaceMemberAdd
+from ..websocket.manager import manager
+from .auth import get_current_user, get_user_by_email
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+def _requested_workspace_id(conn: HTTPConnection) -> int:
+    value = conn.headers.get(WORKSPACE_HEADER) or conn.query_params.get(WORKSPACE_QUERY_PARAM)
+    if value is None:
+        return DEFAULT_WORKSPACE_ID
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的工作區 ID")
+
+
+def check_shard(workspace: WorkspaceContext):
+    """此 worker 不服務工作區所在的分片時回傳 421，並於標頭指出正確的分片"""
+    if not serves_shard(workspace.shard):
+        raise HTTPException(
+            status_code=status.HTTP_421_MISDIRECTED_REQUEST,
+            detail="此工作區由其他分片的服務處理",
+            headers={SHARD_HEADER: workspace.shard_name}
+        )
+
+
+def _get_accessible_workspace(db: Session, workspace_id: int, user_id: int) -> WorkspaceContext:
+    workspace = resolve_workspace(db, workspace_id, user_id)
+    if workspace is None:
+        # 不區分不存在與無權限，避免洩漏工作區是否存在
+        raise HTTPException(status_code=404, detail="找不到工作區")
+    return workspace
+
+
+async def get_current_workspace(
+    conn: HTTPConnection,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+) -> WorkspaceContext:
+    """取得請求的工作區（使用者須可存取，且此 worker 服務其分片）"""
+    workspace = _get_accessible_workspace(db, _requested_workspace_id(conn), current_user.id)
+    check_shard(workspace)
+    return workspace
+
+
+def get_workspace_db(
+    conn: HTTPConnection,
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    primary: Session = Depends(get_db)
+):
+    """工作區所在分片的資料庫依賴（主庫的工作區沿用請求的主庫會話）"""
+    if workspace.shard is None:
+        yield primary
+        return
+    db = open_shard_session(workspace.shard)
+    db.info["connection"] = conn
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_workspace_read_db(
+    workspace: WorkspaceContext = Depends(get_current_workspace),
+    read_db: Session = Depends(get_read_db)
+):
+    """工作區的唯讀資料庫依賴（主庫的工作區沿用請求的唯讀會話，可路由至副本）"""
+    if workspace.shard is None:
+        yield read_db
+        return
+    db = open_shard_session(workspace.shard)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@router.get("/", response_model=List[WorkspaceSchema])
+async def read_workspaces(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """取得使用者可存取的工作區（含預設工作區）"""
+    return db.query(Workspace)\
+        .outerjoin(WorkspaceMember, and_(
+            WorkspaceMember.workspace_id == Workspace.id,
+            WorkspaceMember.user_id == current_user.id
+        ))\
+        .filter(or_(Workspace.id == DEFAULT_WORKSPACE_ID, WorkspaceMember.user_id.isnot(None)))\
+        .order_by(Workspace.id)\
+        .all()
+
+
+@router.post("/", response_model=WorkspaceSchema)
+async def create_workspace(
+    workspace: WorkspaceCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """建立工作區（建立者自動成為成員），可指定存放任務與留言的分片"""
+    if workspace.shard is not None and workspace.shard not in shard_engines:
+        raise HTTPException(status_code=400, detail=f"未設定的分片: {workspace.shard}")
+    
+    db_workspace = Workspace(name=workspace.name, shard=workspace.shard, created_by=current_user.id)
+    db.add(db_workspace)
+    db.flush()
+    db.add(WorkspaceMember(workspace_id=db_workspace.id, user_id=current_user.id))
+    db.flush()
+    
+    # 先複製到分片再提交，複製失敗時主庫不會留下無法使用的工作區
+    copy_to_shard(db_workspace.shard, db_workspace, [current_user])
+    db.commit()
+    db.refresh(db_workspace)
+    return db_workspace
+
+
+@router.post("/{workspace_id}/members")
+async def add_workspace_member(
+    workspace_id: int,
+    member: WorkspaceMemberAdd,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """將使用者加入工作區（只有成員可以加入其他人）"""
+    workspace = _get_accessible_workspace(db, workspace_id, current_user.id)
+    if workspace.id == DEFAULT_WORKSPACE_ID:
+        raise HTTPException(status_code=400, detail="預設工作區不需加入成員")
+    
+    user = get_user_by_email(db, member.email)
+    if user is None:
+        raise HTTPException(status_code=404, detail="找不到使用者")
+    
+    # 重複加入時保留原本的成員資料
+    db.merge(WorkspaceMember(workspace_id=workspace.id, user_id=user.id))
+    db.flush()
+    copy_to_shard(workspace.shard, users=[user])
+    db.commit()
+    return {"message": "成員加入成功"}
+
+
+@router.get("/{workspace_id}/stats")
+async def get_workspace_stats(
+    workspace_id: int,
+    conn: HTTPConnection,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """取得工作區的任務統計與即時連線數（連線數只含此 worker）"""
+    workspace = _get_accessible_workspace(db, workspace_id, current_user.id)
+    check_shard(workspace)
+    
+    workspace_db = open_workspace_read_session(conn, workspace.shard)
+    try:
+        counts = dict(workspace_db.execute(
+            select(Task.status, func.count())
+            .where(Task.workspace_id == workspace.id, Task.deleted_at.is_(None))
+            .group_by(Task.status)
+        ).all())
+    finally:
+        workspace_db.close()
+    
+    return {
+        "workspace_id": workspace.id,
+        "shard": workspace.shard_name,
+        "tasks": {
+            "total": sum(counts.values()),
+            "in_progress": counts.get(TaskStatus.IN_PROGRESS, 0),
+            "completed": counts.get(TaskStatus.COMPLETED, 0)
+        },
+        "websocket": manager.get_workspace_stats(workspace.id)
+    }
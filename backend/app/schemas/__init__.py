@@ -1,9 +1,11 @@
 from .user import User, UserCreate, UserLogin, Token, TokenData
 from .task import Task, TaskCreate, TaskUpdate, TaskWithCreator
-from .comment import Comment, CommentCreate, CommentList, CommentUser
+from .comment import Comment, CommentCreate, CommentImport, CommentList, CommentUser
+from .workspace import Workspace, WorkspaceCreate, WorkspaceMemberAdd
 
 __all__ = [
     "User", "UserCreate", "UserLogin", "Token", "TokenData",
     "Task", "TaskCreate", "TaskUpdate", "TaskWithCreator",
-    "Comment", "CommentCreate", "CommentList", "CommentUser"
+    "Comment", "CommentCreate", "CommentImport", "CommentList", "CommentUser",
+    "Workspace", "WorkspaceCreate", "WorkspaceMemberAdd"
 ]
\ No newline at end of file
@@ -14,6 +14,10 @@ class CommentUser(BaseModel):
 class CommentCreate(BaseModel):
     content: str
 
+# 留言匯入資料列（指定所屬任務）
+class CommentImport(CommentCreate):
+    task_id: int
+
 # 留言回應
 class Comment(BaseModel):
     id: int
@@ -17,6 +17,7 @@ class TaskUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     status: Optional[TaskStatus] = None
+    version: Optional[int] = None  # 編輯時的版本（亦可用 If-Match 標頭），不符時回傳 409
 
 
 class Task(TaskBase):
@@ -25,6 +26,9 @@ class Task(TaskBase):
     created_by: int
     created_at: datetime
     updated_at: datetime
+    version: int = 1
+    comment_count: int = 0
+    last_comment_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -32,6 +36,7 @@ class Task(TaskBase):
 
 class TaskWithCreator(Task):
     creator: dict  # 簡化的建立者資訊
+    archived: bool = False
     
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional
+from datetime import datetime
+
+
+class WorkspaceCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    shard: Optional[str] = None  # 存放任務與留言的分片，未指定時為主庫
+
+
+class Workspace(BaseModel):
+    id: int
+    name: str
+    shard: Optional[str] = None
+    created_by: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class WorkspaceMemberAdd(BaseModel):
+    email: EmailStr
@@ -0,0 +1,156 @@
+"""
+WebSocket 握手快速路徑
+
+- 連線許可：每個 worker 以權杖桶限制新連線速率並限制同時連線數，超過時在升級前拒絕
+- 任務快取：以（工作區, 任務）記住確認存在（有效期限內）與已刪除（永久）的任務，建立與刪除任務時同步更新
+- 使用者快取：token 中的 email 對應的使用者，避免重新連線時重複查詢
+- 工作區快取：使用者可存取的工作區與其分片
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..core.workspaces import WorkspaceContext, resolve_workspace
+from ..models import Task, User
+import math
+import time
+
+
+class BoundedCache:
+    """有容量上限的 LRU 快取，項目可設定有效期限"""
+
+    __slots__ = ("max_size", "_items")
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """寫入項目（ttl 為 None 時不過期）"""
+        self._items[key] = (value, time.monotonic() + ttl if ttl is not None else math.inf)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class CachedUser(NamedTuple):
+    id: int
+    email: str
+
+
+class AdmissionController:
+    """單一 worker 的新連線許可（權杖桶）"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_admit(self, current_connections: int, max_connections: int) -> Optional[float]:
+        """
+        嘗試取得一次連線許可
+
+        回傳:
+            允許時回傳 None，否則回傳建議的重試秒數
+        """
+        if current_connections >= max_connections:
+            self.rejected += 1
+            return settings.ws_reconnect_backoff_max_ms / 1000
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.admitted += 1
+            return None
+
+        self.rejected += 1
+        return (1 - self.tokens) / self.rate
+
+    def get_stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "task_cache_size": len(task_cache),
+            "user_cache_size": len(user_cache),
+            "workspace_cache_size": len(workspace_cache)
+        }
+
+
+admission = AdmissionController(settings.ws_admission_rate_per_second, settings.ws_admission_burst)
+task_cache = BoundedCache(settings.ws_handshake_cache_size)
+user_cache = BoundedCache(settings.ws_handshake_cache_size)
+workspace_cache = BoundedCache(settings.ws_handshake_cache_size)
+
+
+def remember_task_created(workspace_id: int, task_id: int):
+    task_cache.set((workspace_id, task_id), True, settings.ws_handshake_cache_ttl_seconds)
+
+
+def remember_task_deleted(workspace_id: int, task_id: int):
+    # 同一工作區（同一資料庫）的任務 id 不會重複使用，已刪除的紀錄可永久保留
+    task_cache.set((workspace_id, task_id), False)
+
+
+def task_is_open(db: Session, workspace_id: int, task_id: int) -> bool:
+    """任務是否存在於工作區且未刪除（先查快取），db 須為工作區所在的分片"""
+    key = (workspace_id, task_id)
+    cached = task_cache.get(key)
+    if cached is not None:
+        return cached
+
+    row = db.query(Task.deleted_at).filter(Task.id == task_id, Task.workspace_id == workspace_id).first()
+    if row is None:
+        # 已封存、已清除、屬於其他工作區或其他 worker 即將建立的任務，不快取
+        return False
+    exists = row.deleted_at is None
+    task_cache.set(key, exists, settings.ws_handshake_cache_ttl_seconds if exists else None)
+    return exists
+
+
+def resolve_user(db: Session, email: str) -> Optional[CachedUser]:
+    """依 token 中的 email 取得使用者（先查快取）"""
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+
+    row = db.query(User.id, User.email).filter(User.email == email).first()
+    if row is None:
+        return None
+    user = CachedUser(row.id, row.email)
+    user_cache.set(email, user, settings.ws_handshake_cache_ttl_seconds)
+    return user
+
+
+def resolve_user_workspace(db: Session, workspace_id: int, user_id: int) -> Optional[WorkspaceContext]:
+    """取得使用者可存取的工作區（先查快取），db 須為主庫或其副本"""
+    key = (workspace_id, user_id)
+    workspace = workspace_cache.get(key)
+    if workspace is not None:
+        return workspace
+
+    workspace = resolve_workspace(db, workspace_id, user_id)
+    if workspace is not None:
+        workspace_cache.set(key, workspace, settings.ws_handshake_cache_ttl_seconds)
+    return workspace
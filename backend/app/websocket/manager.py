@@ -1,48 +1,100 @@
-from typing import Dict, List
-from fastapi import WebSocket
-import json
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple, Union
+from fastapi import WebSocket, status
+import asyncio
 import logging
+import random
+import time
+from ..core.profiling import span
+from .protocol import JSON_PROTOCOL, EncodedMessageCache, encode_message, send_encoded
 
 logger = logging.getLogger(__name__)
 
+# 留言房間的鍵：（工作區 ID, 任務 ID），不同工作區（分片）的任務 ID 可能相同
+RoomKey = Tuple[int, int]
+
+
+class ConnectionState:
+    """單一 WebSocket 連線的狀態（使用 __slots__ 降低大量閒置連線的記憶體用量）"""
+    
+    __slots__ = ("room", "user_id", "user_email", "protocol", "connected_at", "last_seen")
+    
+    def __init__(self, room: RoomKey, user_id: int, user_email: Optional[str], protocol: str, now: float):
+        self.room = room
+        self.user_id = user_id
+        self.user_email = user_email
+        self.protocol = protocol
+        self.connected_at = now
+        self.last_seen = now
+
+
 class ConnectionManager:
     """管理任務留言的WebSocket連線"""
     
     def __init__(self):
-        # 按任務ID分組的WebSocket連線
-        self.task_connections: Dict[int, List[WebSocket]] = {}
-        # 每個WebSocket連線的使用者資訊
-        self.websocket_info: Dict[WebSocket, Dict] = {}
+        # 按房間（工作區, 任務）分組的WebSocket連線（set 讓加入/離開皆為 O(1)）
+        self.task_connections: Dict[RoomKey, Set[WebSocket]] = {}
+        # 每個WebSocket連線的狀態
+        self.websocket_info: Dict[WebSocket, ConnectionState] = {}
+        # 按房間分組的在線使用者（user_id -> 連線數，同一使用者可能開啟多個分頁）
+        self.task_presence: Dict[RoomKey, Dict[int, int]] = {}
+        # 每個工作區的連線數
+        self.workspace_connections: Dict[int, int] = {}
+        # 背景廣播任務（保留參照避免被回收）
+        self._background_tasks: Set[asyncio.Task] = set()
+        # 心跳統計（供監控使用）
+        self.pings_sent = 0
+        self.reaped_connections = 0
+        # 優雅關閉狀態
+        self.draining = False
+        self.drain_total = 0
+        self.drain_notified = 0
+        self.drain_completed = False
+        # 進行中的留言寫入數量
+        self.in_flight_writes = 0
 
-    async def connect(self, websocket: WebSocket, task_id: int, user_id: int, user_email: str = None):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room: RoomKey,
+        user_id: int,
+        user_email: str = None,
+        protocol: str = JSON_PROTOCOL
+    ):
         """
         使用者加入任務的留言房間
         
         參數:
             websocket: WebSocket連線（已接受）
-            task_id: 任務ID
+            room: 房間（工作區ID, 任務ID）
             user_id: 使用者ID
             user_email: 使用者email（選填，用於顯示名稱）
+            protocol: 協商後的訊息子協定（json 或 msgpack）
         """
-        # 建立任務房間（如果不存在）
-        if task_id not in self.task_connections:
-            self.task_connections[task_id] = []
-        
-        # 加入房間
-        self.task_connections[task_id].append(websocket)
+        # 加入房間（房間不存在時建立）
+        self.task_connections.setdefault(room, set()).add(websocket)
+        workspace_id = room[0]
+        self.workspace_connections[workspace_id] = self.workspace_connections.get(workspace_id, 0) + 1
         
         # 記錄連線資訊
-        self.websocket_info[websocket] = {
-            "user_id": user_id,
-            "task_id": task_id
-        }
+        self.websocket_info[websocket] = ConnectionState(
+            room, user_id, user_email, protocol, time.monotonic()
+        )
+        
+        # 更新在線使用者，同一使用者的其他分頁已在房間時不重複通知
+        room_presence = self.task_presence.setdefault(room, {})
+        user_connections = room_presence.get(user_id, 0) + 1
+        room_presence[user_id] = user_connections
         
-        logger.info(f"User {user_id} connected to task {task_id}")
+        logger.info(f"User {user_id} connected to task {room[1]} of workspace {workspace_id}")
+        
+        if user_connections > 1:
+            return
         
         # 通知房間其他人
         display_name = user_email or f"使用者 {user_id}"
         await self.broadcast_to_task(
-            task_id, 
+            room, 
             {
                 "type": "user_joined",
                 "user_id": user_id,
@@ -56,55 +108,124 @@ class ConnectionManager:
         if websocket not in self.websocket_info:
             return
             
-        info = self.websocket_info[websocket]
-        task_id = info["task_id"]
-        user_id = info["user_id"]
+        # 移除連線的中繼資料
+        info = self.websocket_info.pop(websocket)
+        room = info.room
+        user_id = info.user_id
+        self._release_workspace_connections(room[0], 1)
         
         # 從任務房間移除連線
-        if task_id in self.task_connections:
-            self.task_connections[task_id] = [
-                conn for conn in self.task_connections[task_id] 
-                if conn != websocket
-            ]
+        connections = self.task_connections.get(room)
+        if connections is not None:
+            connections.discard(websocket)
             
             # 清理空的房間
-            if not self.task_connections[task_id]:
-                del self.task_connections[task_id]
+            if not connections:
+                del self.task_connections[room]
         
-        # 移除連線的中繼資料
-        del self.websocket_info[websocket]
+        logger.info(f"User {user_id} disconnected from task {room[1]} of workspace {room[0]}")
+        
+        # 更新在線使用者，最後一個分頁離開時才通知
+        room_presence = self.task_presence.get(room)
+        if room_presence is None or user_id not in room_presence:
+            return
+        user_connections = room_presence[user_id] - 1
+        if user_connections > 0:
+            room_presence[user_id] = user_connections
+            return
+        del room_presence[user_id]
+        if not room_presence:
+            del self.task_presence[room]
         
-        logger.info(f"User {user_id} disconnected from task {task_id}")
+        # 排空期間所有人都會離開，不需逐一通知
+        if room in self.task_connections and not self.draining:
+            display_name = info.user_email or f"使用者 {user_id}"
+            self._schedule_broadcast(room, {
+                "type": "user_left",
+                "user_id": user_id,
+                "message": f"{display_name} 離開了留言"
+            })
+
+    def _release_workspace_connections(self, workspace_id: int, count: int):
+        remaining = self.workspace_connections.get(workspace_id, 0) - count
+        if remaining > 0:
+            self.workspace_connections[workspace_id] = remaining
+        else:
+            self.workspace_connections.pop(workspace_id, None)
+
+    def _spawn(self, coroutine) -> Optional[asyncio.Task]:
+        """在背景執行協程並保留參照（沒有執行中的事件迴圈時略過）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            coroutine.close()
+            return None
+        task = loop.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def _schedule_broadcast(self, room: RoomKey, message: dict):
+        """在背景廣播訊息（供同步的 disconnect 使用）"""
+        self._spawn(self.broadcast_to_task(room, message))
 
-    async def broadcast_to_task(self, task_id: int, message: dict, exclude_websocket: WebSocket = None):
+    async def _close_quietly(self, websocket: WebSocket, code: int, message: Union[str, bytes, None] = None):
+        """（選擇性先送出訊息後）關閉連線，忽略已斷線造成的錯誤"""
+        try:
+            if message is not None:
+                await send_encoded(websocket, message)
+            await websocket.close(code=code)
+        except Exception:
+            # 半開連線關閉時可能失敗，已從房間移除即可
+            pass
+
+    async def broadcast_to_task(self, room: RoomKey, message: dict, exclude_websocket: WebSocket = None):
         """
         向任務房間內的所有連線廣播訊息
         
         參數:
-            task_id: 目標任務房間 ID
+            room: 目標房間（工作區ID, 任務ID）
             message: 要廣播的訊息資料
             exclude_websocket: 要從廣播中排除的連線（選填）
         """
-        if task_id not in self.task_connections:
+        connections = self.task_connections.get(room)
+        if not connections:
             return
         
         # 追蹤失敗的連線以便清理
         invalid_connections = []
+        # 每種子協定只編碼一次
+        encoded = EncodedMessageCache(message)
         
-        for websocket in self.task_connections[task_id]:
-            if exclude_websocket and websocket == exclude_websocket:
-                continue
-                
-            try:
-                await websocket.send_text(json.dumps(message, ensure_ascii=False, default=str))
-            except Exception as e:
-                logger.error(f"Error sending message to websocket: {e}")
-                invalid_connections.append(websocket)
+        # 以快照迭代，傳送期間房間可能有連線加入或離開
+        with span("ws_broadcast"):
+            for websocket in tuple(connections):
+                if exclude_websocket and websocket == exclude_websocket:
+                    continue
+                info = self.websocket_info.get(websocket)
+                if info is None:
+                    continue
+                    
+                try:
+                    await send_encoded(websocket, encoded.get(info.protocol))
+                except Exception as e:
+                    logger.error(f"Error sending message to websocket: {e}")
+                    invalid_connections.append(websocket)
         
         # 清理失敗的連線
         for invalid_conn in invalid_connections:
             self.disconnect(invalid_conn)
 
+    async def send_message(self, websocket: WebSocket, message: dict):
+        """以連線協商的子協定向特定連線發送訊息"""
+        info = self.websocket_info.get(websocket)
+        protocol = info.protocol if info is not None else JSON_PROTOCOL
+        try:
+            await send_encoded(websocket, encode_message(message, protocol))
+        except Exception as e:
+            logger.error(f"Error sending message to websocket: {e}")
+            self.disconnect(websocket)
+
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """向特定的 WebSocket 連線發送訊息"""
         try:
@@ -113,15 +234,223 @@ class ConnectionManager:
             logger.error(f"Error sending personal message: {e}")
             self.disconnect(websocket)
 
-    def get_task_connection_count(self, task_id: int) -> int:
+    def touch(self, websocket: WebSocket):
+        """記錄連線最後一次收到客戶端訊息（含 pong）的時間"""
+        info = self.websocket_info.get(websocket)
+        if info is not None:
+            info.last_seen = time.monotonic()
+
+    def get_idle_seconds(self, websocket: WebSocket) -> float:
+        """取得連線的閒置秒數，未註冊的連線回傳 0"""
+        info = self.websocket_info.get(websocket)
+        if info is None:
+            return 0.0
+        return time.monotonic() - info.last_seen
+
+    async def sweep_idle_connections(self, timeout: float) -> int:
+        """
+        關閉並移除閒置超過 timeout 秒的連線，其餘連線送出 ping
+        
+        參數:
+            timeout: 閒置逾時秒數
+        
+        回傳:
+            本次清理的連線數量
+        """
+        now = time.monotonic()
+        stale_connections = []
+        alive_connections = []
+        
+        for websocket, info in self.websocket_info.items():
+            if now - info.last_seen > timeout:
+                stale_connections.append(websocket)
+            else:
+                alive_connections.append(websocket)
+        
+        # 先全部移除閒置連線，避免廣播時再對其送出訊息
+        for websocket in stale_connections:
+            info = self.websocket_info[websocket]
+            logger.info(
+                f"Reaping idle connection of user {info.user_id} on task {info.room[1]} "
+                f"(idle {now - info.last_seen:.1f}s)"
+            )
+            self.disconnect(websocket)
+        self.reaped_connections += len(stale_connections)
+        
+        # 半開連線的關閉握手會等到逾時，於背景關閉，不阻塞心跳迴圈
+        for websocket in stale_connections:
+            self._spawn(self._close_quietly(websocket, status.WS_1001_GOING_AWAY))
+        
+        ping_message = EncodedMessageCache({"type": "ping"})
+        for websocket in alive_connections:
+            info = self.websocket_info.get(websocket)
+            if info is None:
+                continue
+            try:
+                await send_encoded(websocket, ping_message.get(info.protocol))
+                self.pings_sent += 1
+            except Exception as e:
+                logger.error(f"Error sending ping to websocket: {e}")
+                self.disconnect(websocket)
+        
+        return len(stale_connections)
+
+    async def run_heartbeat(self, interval: float, timeout: float):
+        """背景心跳迴圈：定期送出 ping 並清理閒置連線，直到被取消"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep_idle_connections(timeout)
+            except Exception as e:
+                logger.error(f"Heartbeat sweep failed: {e}")
+
+    @contextmanager
+    def track_write(self):
+        """標記一筆進行中的留言寫入，優雅關閉時會等待其完成"""
+        self.in_flight_writes += 1
+        try:
+            yield
+        finally:
+            self.in_flight_writes -= 1
+
+    async def drain(
+        self,
+        batch_size: int,
+        batch_interval: float,
+        backoff_min_ms: int,
+        backoff_max_ms: int,
+        write_timeout: float
+    ):
+        """
+        優雅關閉所有連線：停止接受新連線，分批通知客戶端重連後關閉，最後等待留言寫入完成
+        
+        參數:
+            batch_size: 每批通知的連線數量
+            batch_interval: 批次之間的間隔秒數
+            backoff_min_ms: 建議客戶端重連前等待的最短毫秒數
+            backoff_max_ms: 建議客戶端重連前等待的最長毫秒數
+            write_timeout: 等待進行中留言寫入與連線關閉的最長秒數
+        """
+        if self.draining:
+            return
+        self.draining = True
+        
+        connections = list(self.websocket_info.keys())
+        self.drain_total = len(connections)
+        logger.info(f"Draining {self.drain_total} websocket connections")
+        
+        # 每批的通知與關閉同時進行，關閉握手（半開連線會等到逾時）不拖慢後續批次
+        closing = []
+        for start in range(0, len(connections), batch_size):
+            if start > 0 and batch_interval > 0:
+                await asyncio.sleep(batch_interval)
+            
+            for websocket in connections[start:start + batch_size]:
+                # 期間可能已自行斷線
+                info = self.websocket_info.get(websocket)
+                if info is not None:
+                    self.disconnect(websocket)
+                    reconnect_message = {
+                        "type": "reconnect",
+                        "retry_after_ms": random.randint(backoff_min_ms, max(backoff_min_ms, backoff_max_ms))
+                    }
+                    task = self._spawn(self._close_quietly(
+                        websocket, status.WS_1012_SERVICE_RESTART, encode_message(reconnect_message, info.protocol)
+                    ))
+                    if task is not None:
+                        closing.append(task)
+                self.drain_notified += 1
+        
+        # 等待進行中的留言寫入與連線關閉完成
+        deadline = time.monotonic() + write_timeout
+        while self.in_flight_writes > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.in_flight_writes > 0:
+            logger.warning(f"Drain finished with {self.in_flight_writes} comment writes still in flight")
+        if closing:
+            _, pending = await asyncio.wait(closing, timeout=max(0.0, deadline - time.monotonic()))
+            if pending:
+                logger.warning(f"Drain finished with {len(pending)} websocket closes still pending")
+        
+        self.drain_completed = True
+        logger.info("Websocket drain completed")
+
+    def get_drain_status(self) -> dict:
+        """取得優雅關閉進度"""
+        return {
+            "draining": self.draining,
+            "total": self.drain_total,
+            "notified": self.drain_notified,
+            "in_flight_writes": self.in_flight_writes,
+            "completed": self.drain_completed
+        }
+
+    def get_stats(self) -> dict:
+        """取得連線統計資訊（供健康檢查與監控使用）"""
+        now = time.monotonic()
+        idle_times = [now - info.last_seen for info in self.websocket_info.values()]
+        return {
+            "connections": len(self.websocket_info),
+            "rooms": len(self.task_connections),
+            "workspaces": len(self.workspace_connections),
+            "max_idle_seconds": round(max(idle_times), 1) if idle_times else 0.0,
+            "pings_sent": self.pings_sent,
+            "reaped_connections": self.reaped_connections
+        }
+
+    def get_workspace_stats(self, workspace_id: int) -> dict:
+        """取得特定工作區的連線統計"""
+        return {
+            "connections": self.workspace_connections.get(workspace_id, 0),
+            "rooms": sum(1 for room in self.task_connections if room[0] == workspace_id)
+        }
+
+    async def close_task_room(self, room: RoomKey):
+        """任務被刪除時通知房間內所有連線並關閉房間"""
+        if room not in self.task_connections:
+            return
+        
+        await self.broadcast_to_task(room, {"type": "task_deleted", "task_id": room[1]})
+        
+        # 整個房間一次移除，不逐一發送離開通知
+        connections = self.task_connections.pop(room, set())
+        self.task_presence.pop(room, None)
+        for websocket in connections:
+            if self.websocket_info.pop(websocket, None) is not None:
+                self._release_workspace_connections(room[0], 1)
+            try:
+                # 正常關閉碼，客戶端不會自動重連
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE)
+            except Exception:
+                pass
+        
+        logger.info(f"Closed room of deleted task {room[1]} of workspace {room[0]} ({len(connections)} connections)")
+
+    def get_task_presence(self, room: RoomKey) -> List[dict]:
+        """取得任務房間的在線使用者（每位使用者一筆，含開啟的連線數）"""
+        room_presence = self.task_presence.get(room, {})
+        emails = {}
+        for websocket in self.task_connections.get(room, ()):
+            info = self.websocket_info[websocket]
+            emails[info.user_id] = info.user_email
+        return [
+            {
+                "user_id": user_id,
+                "email": emails.get(user_id),
+                "connections": connections
+            }
+            for user_id, connections in room_presence.items()
+        ]
+
+    def get_task_connection_count(self, room: RoomKey) -> int:
         """取得特定任務房間的連線數量"""
-        if task_id not in self.task_connections:
+        if room not in self.task_connections:
             return 0
-        return len(self.task_connections[task_id])
+        return len(self.task_connections[room])
 
     def get_all_connections_count(self) -> int:
         """取得所有房間的總活躍連線數量"""
-        return sum(len(connections) for connections in self.task_connections.values())
+        return len(self.websocket_info)
 
 # 全域連線管理器實例
 manager = ConnectionManager()
\ No newline at end of file
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional, Union
+from fastapi import WebSocket
+import json
+import msgpack
+
+# 支援的 WebSocket 子協定（Sec-WebSocket-Protocol）
+JSON_PROTOCOL = "json"
+MSGPACK_PROTOCOL = "msgpack"
+SUPPORTED_PROTOCOLS = (JSON_PROTOCOL, MSGPACK_PROTOCOL)
+
+
+class MessageDecodeError(ValueError):
+    """客戶端訊息無法解碼"""
+
+
+def select_protocol(requested: List[str]) -> Optional[str]:
+    """
+    依客戶端偏好順序選出第一個支援的子協定
+
+    參數:
+        requested: 客戶端在 Sec-WebSocket-Protocol 中列出的子協定
+
+    回傳:
+        選定的子協定；客戶端未要求或皆不支援時回傳 None（使用 JSON，且不回應子協定標頭）
+    """
+    for protocol in requested:
+        if protocol in SUPPORTED_PROTOCOLS:
+            return protocol
+    return None
+
+
+def encode_message(message: dict, protocol: str) -> Union[str, bytes]:
+    """將訊息編碼為對應子協定的訊框內容（JSON 為文字，MessagePack 為二進位）"""
+    if protocol == MSGPACK_PROTOCOL:
+        return msgpack.packb(message, default=str)
+    return json.dumps(message, ensure_ascii=False, default=str)
+
+
+def decode_message(frame: dict) -> dict:
+    """
+    解碼客戶端送來的 ASGI websocket.receive 訊框
+
+    文字訊框一律以 JSON 解析，二進位訊框以 MessagePack 解析
+    """
+    try:
+        if frame.get("bytes") is not None:
+            return msgpack.unpackb(frame["bytes"])
+        return json.loads(frame.get("text") or "")
+    except (ValueError, msgpack.UnpackException) as e:
+        raise MessageDecodeError(str(e)) from e
+
+
+async def send_encoded(websocket: WebSocket, payload: Union[str, bytes]):
+    """依編碼結果的型別送出文字或二進位訊框"""
+    if isinstance(payload, bytes):
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_text(payload)
+
+
+class EncodedMessageCache:
+    """同一則廣播訊息在每種子協定只編碼一次"""
+
+    __slots__ = ("message", "payloads")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.payloads: Dict[str, Union[str, bytes]] = {}
+
+    def get(self, protocol: str) -> Union[str, bytes]:
+        payload = self.payloads.get(protocol)
+        if payload is None:
+            payload = self.payloads[protocol] = encode_message(self.message, protocol)
+        return payload
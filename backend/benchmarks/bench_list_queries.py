@@ -0,0 +1,167 @@
+"""
+列表查詢 ORM 與 Core 熱路徑效能基準測試
+
+比較任務列表與留言列表兩種讀取方式每秒可產生的資料列數：
+- orm：原本的 db.query(...).options(joinedload(...)) 後逐一轉為 dict
+- core：app.core.queries 的快取 Core 語句，資料列直接組成 dict
+會在 DATABASE_URL 指向的資料庫建立測試使用者，並補足所需數量的任務與留言。
+
+執行方式（於 backend 目錄）:
+    python -m benchmarks.bench_list_queries --sizes 100 10000
+"""
+import argparse
+import time
+from typing import Callable, List
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import joinedload
+
+from app.core.database import SessionLocal, engine
+from app.core.queries import list_comments, list_tasks
+from app.core.security import get_password_hash
+from app.core.startup import create_tables
+from app.models import DEFAULT_WORKSPACE_ID, Comment, Task, User
+from app.models.task import TaskStatus
+
+BENCH_EMAIL = "list-bench@example.com"
+
+
+def prepare(rows: int) -> int:
+    """確保至少有 rows 筆未刪除任務，且其中一個任務有 rows 則留言，回傳該任務 id"""
+    create_tables()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = User(email=BENCH_EMAIL, password_hash=get_password_hash("benchmark"))
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+        
+        existing = db.execute(select(func.count()).where(
+            Task.workspace_id == DEFAULT_WORKSPACE_ID, Task.deleted_at.is_(None)
+        )).scalar()
+        if existing < rows:
+            db.execute(insert(Task.__table__), [
+                {
+                    "title": f"List benchmark task {index}",
+                    "description": "Benchmark task description " * 4,
+                    "status": TaskStatus.IN_PROGRESS,
+                    "created_by": user.id
+                }
+                for index in range(rows - existing)
+            ])
+        
+        task_id = db.execute(
+            select(Task.id).where(Task.created_by == user.id, Task.deleted_at.is_(None)).order_by(Task.id)
+        ).scalars().first()
+        comments = db.execute(select(func.count()).where(Comment.task_id == task_id)).scalar()
+        if comments < rows:
+            db.execute(insert(Comment.__table__), [
+                {"content": f"Benchmark comment {index}", "task_id": task_id, "user_id": user.id}
+                for index in range(rows - comments)
+            ])
+        db.commit()
+        return task_id
+    finally:
+        db.close()
+
+
+def orm_tasks(db, limit: int) -> List[dict]:
+    tasks = db.query(Task).options(joinedload(Task.creator))\
+        .filter(Task.workspace_id == DEFAULT_WORKSPACE_ID, Task.deleted_at.is_(None))\
+        .order_by(Task.created_at.desc())\
+        .offset(0)\
+        .limit(limit)\
+        .all()
+    return [
+        {
+            "id": task.id,
+            "title": task.title,
+            "description": task.description,
+            "status": task.status,
+            "created_by": task.created_by,
+            "created_at": task.created_at,
+            "updated_at": task.updated_at,
+            "version": task.version,
+            "comment_count": task.comment_count,
+            "last_comment_at": task.last_comment_at,
+            "creator": {
+                "id": task.creator.id,
+                "email": task.creator.email
+            }
+        }
+        for task in tasks
+    ]
+
+
+def orm_comments(db, task_id: int, limit: int) -> List[dict]:
+    comments = db.query(Comment)\
+        .options(joinedload(Comment.user))\
+        .filter(Comment.task_id == task_id)\
+        .order_by(Comment.created_at.asc())\
+        .offset(0)\
+        .limit(limit)\
+        .all()
+    return [
+        {
+            "id": comment.id,
+            "content": comment.content,
+            "task_id": comment.task_id,
+            "user_id": comment.user_id,
+            "created_at": comment.created_at,
+            "user": {
+                "id": comment.user.id,
+                "email": comment.user.email
+            }
+        }
+        for comment in comments
+    ]
+
+
+def measure(read: Callable, rows: int, min_seconds: float) -> float:
+    """重複讀取至少 min_seconds 秒（每次使用新會話，同一般請求），回傳每秒資料列數"""
+    def read_once() -> List[dict]:
+        db = SessionLocal()
+        try:
+            return read(db)
+        finally:
+            db.close()
+    
+    read_once()  # 暖身（編譯快取、連線池）
+    total_rows = 0
+    started = time.perf_counter()
+    while True:
+        result = read_once()
+        assert len(result) == rows, f"expected {rows} rows, got {len(result)}"
+        total_rows += len(result)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return total_rows / elapsed
+
+
+def run(sizes: List[int], min_seconds: float):
+    task_id = prepare(max(sizes))
+    print(f"database: {engine.url.render_as_string(hide_password=True)}")
+    for rows in sizes:
+        cases = (
+            ("tasks", lambda db: orm_tasks(db, rows), lambda db: list_tasks(db, DEFAULT_WORKSPACE_ID, None, "created_at", 0, rows)),
+            ("comments", lambda db: orm_comments(db, task_id, rows), lambda db: list_comments(db, task_id, 0, rows))
+        )
+        for name, orm_read, core_read in cases:
+            orm_rate = measure(orm_read, rows, min_seconds)
+            core_rate = measure(core_read, rows, min_seconds)
+            print(f"{name:<9} {rows:>6} rows  orm: {orm_rate:>9.0f} rows/s  "
+                  f"core: {core_rate:>9.0f} rows/s  ({core_rate / orm_rate:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表查詢 ORM 與 Core 熱路徑效能基準測試")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000], help="每次讀取的資料列數")
+    parser.add_argument("--seconds", type=float, default=3.0, help="每種情境至少量測的秒數")
+    args = parser.parse_args()
+    run(args.sizes, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+API 程序啟動時間基準測試
+
+以子程序啟動 uvicorn，量測開始監聽（/health 回應）、就緒（/ready 回應 200）所需時間，
+以及就緒後第一個與第二個已驗證請求（GET /tasks/）的延遲，分別比較停用與啟用預熱。
+就緒時間超過預算時以非零結束碼結束，可用於部署前檢查。
+會在 DATABASE_URL 指向的資料庫建立一個測試使用者。
+
+執行方式（於 backend 目錄）:
+    python -m benchmarks.bench_startup --budget 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.security import create_access_token, get_password_hash
+from app.core.startup import create_tables
+from app.models import User
+
+BENCH_EMAIL = "startup-bench@example.com"
+
+
+def prepare() -> str:
+    """建立資料表與測試使用者，回傳 token"""
+    create_tables()
+    db = SessionLocal()
+    try:
+        if db.query(User).filter(User.email == BENCH_EMAIL).first() is None:
+            db.add(User(email=BENCH_EMAIL, password_hash=get_password_hash("benchmark")))
+            db.commit()
+        return create_access_token({"sub": BENCH_EMAIL})
+    finally:
+        db.close()
+
+
+def request(url: str, token: Optional[str] = None) -> Tuple[Optional[int], Optional[dict]]:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+    except OSError:
+        return None, None
+
+
+def wait_for(url: str, started: float, timeout: float, expected: Optional[int] = None) -> Tuple[float, dict]:
+    """輪詢直到收到回應（或指定狀態碼），回傳自啟動起算的秒數與回應內容"""
+    while time.perf_counter() - started < timeout:
+        status, body = request(url)
+        if status is not None and (expected is None or status == expected):
+            return time.perf_counter() - started, body
+        time.sleep(0.01)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def run_once(port: int, token: str, warmup: bool, timeout: float) -> float:
+    base_url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "STARTUP_WARMUP_ENABLED": "true" if warmup else "false"}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env
+    )
+    try:
+        listening, _ = wait_for(f"{base_url}/health", started, timeout)
+        ready, body = wait_for(f"{base_url}/ready", started, timeout, expected=200)
+        latencies = []
+        for _ in range(2):
+            request_started = time.perf_counter()
+            status, _ = request(f"{base_url}/tasks/", token)
+            if status != 200:
+                raise SystemExit(f"GET /tasks/ returned {status}")
+            latencies.append((time.perf_counter() - request_started) * 1000)
+    finally:
+        server.terminate()
+        server.wait()
+    
+    startup = body["startup"]
+    print(f"warm-up {'enabled' if warmup else 'disabled'}")
+    print(f"  app import (in process):  {startup['import_seconds']:.2f}s")
+    print(f"  listening (/health):      {listening:.2f}s")
+    print(f"  ready (/ready):           {ready:.2f}s")
+    print(f"  first / second request:   {latencies[0]:.1f}ms / {latencies[1]:.1f}ms")
+    return ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 程序啟動時間基準測試")
+    parser.add_argument("--port", type=int, default=8798, help="測試伺服器埠號")
+    parser.add_argument("--budget", type=float, default=settings.startup_time_budget_seconds, help="就緒時間預算（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="等待啟動的最長秒數")
+    args = parser.parse_args()
+    
+    token = prepare()
+    run_once(args.port, token, warmup=False, timeout=args.timeout)
+    ready = run_once(args.port, token, warmup=True, timeout=args.timeout)
+    if ready > args.budget:
+        raise SystemExit(f"Ready after {ready:.2f}s, over the {args.budget:.2f}s budget")
+    print(f"ready within budget ({ready:.2f}s <= {args.budget:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+WebSocket 重新連線風暴基準測試
+
+於同一程序啟動 uvicorn，模擬大量客戶端同時重新連線（完成握手後立即關閉），
+量測每秒完成的握手數與握手延遲，分別比較快取冷/熱、無效 token 的拒絕速率，
+以及啟用連線許可限制時被退回（503）的比例。
+會在 DATABASE_URL 指向的資料庫建立一個測試使用者與任務。
+
+執行方式（於 backend 目錄）:
+    python -m benchmarks.bench_ws_reconnect --clients 10000 --concurrency 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import Tuple
+
+import uvicorn
+from websockets.asyncio.client import connect
+from websockets.exceptions import InvalidStatus
+
+import main
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.security import create_access_token, get_password_hash
+from app.core.startup import create_tables
+from app.models import Task, User
+from app.websocket import handshake
+
+BENCH_EMAIL = "ws-bench@example.com"
+
+
+def prepare() -> Tuple[str, int]:
+    """建立測試使用者與任務，回傳 (token, task_id)"""
+    create_tables()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = User(email=BENCH_EMAIL, password_hash=get_password_hash("benchmark"))
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+        task = Task(title="WebSocket reconnect benchmark", created_by=user.id)
+        db.add(task)
+        db.commit()
+        db.refresh(task)
+        return create_access_token({"sub": user.email}), task.id
+    finally:
+        db.close()
+
+
+async def storm(url: str, clients: int, concurrency: int) -> Tuple[Counter, list, float]:
+    """同時發起 clients 次連線（最多 concurrency 個同時進行中）"""
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes = Counter()
+    latencies = []
+    
+    async def client():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with connect(url, open_timeout=60, compression=None):
+                    pass
+                latencies.append(time.perf_counter() - started)
+                outcomes["accepted"] += 1
+            except InvalidStatus as e:
+                outcomes[f"http {e.response.status_code}"] += 1
+            except Exception as e:
+                outcomes[type(e).__name__] += 1
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return outcomes, latencies, time.perf_counter() - started
+
+
+def report(name: str, clients: int, outcomes: Counter, latencies: list, elapsed: float):
+    print(f"{name}")
+    print(f"  outcomes:             {dict(outcomes)}")
+    print(f"  connects/s:           {clients / elapsed:.0f} ({elapsed:.2f}s total)")
+    if latencies:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"  handshake p50 / p99:  {statistics.median(latencies) * 1000:.1f}ms / {p99 * 1000:.1f}ms")
+
+
+async def run(clients: int, concurrency: int, port: int):
+    token, task_id = prepare()
+    url = f"ws://127.0.0.1:{port}/ws/tasks/{task_id}"
+    
+    server = uvicorn.Server(uvicorn.Config(main.app, port=port, log_level="error", ws_per_message_deflate=False))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    
+    try:
+        # 量測握手本身的成本時暫時解除許可限制
+        admission = handshake.admission
+        admission.rate, admission.burst, admission.tokens = float("inf"), clients, float(clients)
+        
+        handshake.task_cache.clear()
+        handshake.user_cache.clear()
+        report("cold caches (first connect queries user and task)", 1, *await storm(f"{url}?token={token}", 1, 1))
+        report("warm caches", clients, *await storm(f"{url}?token={token}", clients, concurrency))
+        report("invalid token (rejected before accept)", clients, *await storm(f"{url}?token=invalid", clients, concurrency))
+        
+        admission.rate = settings.ws_admission_rate_per_second
+        admission.burst = settings.ws_admission_burst
+        admission.tokens = float(admission.burst)
+        report(
+            f"admission limit ({settings.ws_admission_rate_per_second:.0f}/s, burst {settings.ws_admission_burst})",
+            clients, *await storm(f"{url}?token={token}", clients, concurrency)
+        )
+    finally:
+        server.should_exit = True
+        await serve
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="WebSocket 重新連線風暴基準測試")
+    parser.add_argument("--clients", type=int, default=10000, help="重新連線的客戶端數")
+    parser.add_argument("--concurrency", type=int, default=500, help="同時進行中的握手數")
+    parser.add_argument("--port", type=int, default=8799, help="測試伺服器埠號")
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.concurrency, args.port))
+
+
+if __name__ == "__main__":
+    main_cli()
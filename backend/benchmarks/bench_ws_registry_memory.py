@@ -0,0 +1,83 @@
+"""
+WebSocket 房間註冊表記憶體與加入/離開效能基準測試
+
+以假的 WebSocket 物件模擬大量閒置連線，量測 ConnectionManager 每條連線的記憶體用量，
+以及大型房間全部離開所需的時間。
+
+執行方式（於 backend 目錄）:
+    python -m benchmarks.bench_ws_registry_memory --connections 50000 --room-size 50
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from app.websocket.manager import ConnectionManager
+
+
+class IdleWebSocket:
+    """僅實作廣播所需介面的閒置連線"""
+    
+    __slots__ = ()
+    
+    async def send_text(self, data: str):
+        pass
+    
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run(connections: int, room_size: int, tabs_per_user: int):
+    manager = ConnectionManager()
+    sockets = [IdleWebSocket() for _ in range(connections)]
+    
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    
+    for index, websocket in enumerate(sockets):
+        task_id = index // room_size
+        user_id = index // tabs_per_user
+        await manager.connect(websocket, (1, task_id), user_id, f"user{user_id}@example.com")
+    
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    used = current - baseline
+    print(f"connections:            {manager.get_all_connections_count()}")
+    print(f"rooms:                  {len(manager.task_connections)}")
+    print(f"registry memory:        {used / 1024 / 1024:.2f} MiB")
+    print(f"bytes per connection:   {used / connections:.0f}")
+    print(f"peak memory:            {(peak - baseline) / 1024 / 1024:.2f} MiB")
+    
+    started = time.perf_counter()
+    for websocket in sockets:
+        manager.disconnect(websocket)
+    leave_seconds = time.perf_counter() - started
+    print(f"leave time:             {leave_seconds:.3f}s ({connections / leave_seconds:.0f} leaves/s)")
+    # 等待背景的離開通知送完
+    await asyncio.gather(*manager._background_tasks)
+    
+    # 單一大型房間清空（舊版 list 實作為 O(n²)）；同一使用者的多個分頁只會通知一次
+    big_room = [IdleWebSocket() for _ in range(connections)]
+    for websocket in big_room:
+        await manager.connect(websocket, (1, 0), 0, "user0@example.com")
+    started = time.perf_counter()
+    for websocket in big_room:
+        manager.disconnect(websocket)
+    print(f"empty {connections}-socket room: {time.perf_counter() - started:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=50000)
+    parser.add_argument("--room-size", type=int, default=50)
+    parser.add_argument("--tabs-per-user", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.connections, args.room_size, args.tabs_per_user))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,129 @@
+import time
+
+# 開始匯入應用的時間點，用於量測由匯入到就緒的啟動耗時
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+import asyncio
+import signal
 from app.core.config import settings
-from app.core.database import engine
-from app.models import Base
-from app.routers import auth, tasks, comments, websocket
+from app.core.database import ReadYourWritesMiddleware
+from app.core.negotiation import ContentNegotiationMiddleware, NegotiatedResponse
+from app.core.profiling import ProfilingMiddleware
+from app.core.queries import warm_statements
+from app.core.startup import create_tables, mark_ready, run_warm_up, startup_state
+from app.core.workspaces import resolve_workspace
+from app.routers import auth, tasks, comments, websocket, workspaces, debug
+from app.jobs.task_purger import run_task_purger
+from app.websocket.handshake import admission, resolve_user, task_is_open
+from app.websocket.manager import manager
+
+
+def warm_hot_queries(db: Session):
+    """填入熱路徑查詢的編譯快取：列表、身分驗證、工作區與 WebSocket 握手（查詢不存在的資料，不寫入快取）"""
+    warm_statements(db)
+    auth.get_user_by_email(db, "")
+    resolve_user(db, "")
+    resolve_workspace(db, 0, 0)
+    task_is_open(db, 0, 0)
+
+
+async def drain_websockets():
+    """依設定分批通知 WebSocket 客戶端重連並關閉連線"""
+    await manager.drain(
+        batch_size=settings.ws_drain_batch_size,
+        batch_interval=settings.ws_drain_batch_interval_seconds,
+        backoff_min_ms=settings.ws_reconnect_backoff_min_ms,
+        backoff_max_ms=settings.ws_reconnect_backoff_max_ms,
+        write_timeout=settings.ws_drain_write_timeout_seconds
+    )
+
+
+def install_drain_signal_handler():
+    """
+    攔截 SIGTERM：先完成 WebSocket 優雅關閉，再交還給伺服器原本的處理程序
+    
+    uvicorn 在執行 lifespan shutdown 之前就會切斷所有連線，因此必須在收到訊號時先行排空。
+    再次收到 SIGTERM 時直接交給原處理程序。
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        previous_handler = signal.getsignal(signal.SIGTERM)
+    except ValueError:
+        return None
+    
+    def exit_with_previous_handler(sig, frame):
+        if callable(previous_handler):
+            previous_handler(sig, frame)
+        else:
+            signal.signal(sig, previous_handler)
+            signal.raise_signal(sig)
+    
+    async def drain_then_exit(sig, frame):
+        await drain_websockets()
+        exit_with_previous_handler(sig, frame)
+    
+    def handle_sigterm(sig, frame):
+        if manager.draining:
+            exit_with_previous_handler(sig, frame)
+            return
+        loop.call_soon_threadsafe(lambda: loop.create_task(drain_then_exit(sig, frame)))
+    
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        # 非主執行緒無法註冊訊號處理程序
+        return None
+    return previous_handler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """應用生命週期：建立資料表、於背景預熱並啟動 WebSocket 心跳與已刪除任務清除等背景任務，關閉時優雅排空連線"""
+    if settings.create_tables_on_startup:
+        await asyncio.to_thread(create_tables)
+    
+    background_tasks = [
+        asyncio.create_task(
+            manager.run_heartbeat(
+                settings.ws_heartbeat_interval_seconds,
+                settings.ws_heartbeat_timeout_seconds
+            )
+        ),
+        asyncio.create_task(
+            run_task_purger(
+                settings.task_purge_interval_seconds,
+                settings.task_purge_batch_size
+            )
+        )
+    ]
+    if settings.startup_warmup_enabled:
+        background_tasks.append(asyncio.create_task(run_warm_up([warm_hot_queries], IMPORT_STARTED)))
+    else:
+        mark_ready(IMPORT_STARTED)
+    install_drain_signal_handler()
+    try:
+        yield
+    finally:
+        # 未經由 SIGTERM 觸發時（例如其他伺服器或測試環境）在此排空
+        await drain_websockets()
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
 
-# 建立資料庫表格
-Base.metadata.create_all(bind=engine)
 
 # 建立 FastAPI 應用
 app = FastAPI(
     title="任務管理與即時留言系統",
     description="使用 FastAPI 和 WebSocket 的任務管理系統",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # 依 Accept 標頭回傳 JSON 或 MessagePack
+    default_response_class=NegotiatedResponse
 )
 
 # 設定 CORS
@@ -22,13 +133,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 讓瀏覽器開發者工具可讀取分段耗時與剖析編號
+    expose_headers=["Server-Timing", "X-Profile-Id", "ETag", "X-Workspace-Shard"],
 )
 
+# 回應格式協商與壓縮
+app.add_middleware(ContentNegotiationMiddleware)
+
+# 讀己之寫：寫入後以 cookie 標記，跨 worker 的後續讀取改走主庫
+app.add_middleware(ReadYourWritesMiddleware)
+
+# 請求效能追蹤（最後加入即為最外層，涵蓋完整處理時間）
+app.add_middleware(ProfilingMiddleware)
+
 # 包含路由
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
 app.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
 app.include_router(comments.router, tags=["comments"])
+app.include_router(comments.batch_router, tags=["comments"])
 app.include_router(websocket.router, tags=["websocket"])
+app.include_router(workspaces.router, prefix="/workspaces", tags=["workspaces"])
+app.include_router(debug.router, prefix="/debug", tags=["debug"])
 
 @app.get("/")
 async def root():
@@ -36,7 +161,38 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "environment": settings.environment}
+    # 優雅關閉期間回傳 503，讓負載平衡器停止導流並由編排器追蹤排空進度
+    if manager.draining:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "draining",
+                "environment": settings.environment,
+                "drain": manager.get_drain_status()
+            }
+        )
+    return {
+        "status": "healthy",
+        "environment": settings.environment,
+        "startup": startup_state.get_status(),
+        "websocket": manager.get_stats(),
+        "websocket_admission": admission.get_stats()
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    # 預熱完成前與優雅關閉期間回傳 503，負載平衡器只將流量導向已就緒的程序（/health 只代表程序存活）
+    if manager.draining or not startup_state.ready:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "draining" if manager.draining else "starting",
+                "startup": startup_state.get_status()
+            }
+        )
+    return {"status": "ready", "startup": startup_state.get_status()}
+
+startup_state.import_seconds = time.perf_counter() - IMPORT_STARTED
 
 if __name__ == "__main__":
     import uvicorn
@@ -44,5 +200,6 @@ if __name__ == "__main__":
         "main:app",
         host=settings.host,
         port=settings.port,
-        reload=True if settings.environment == "development" else False
+        reload=True if settings.environment == "development" else False,
+        ws_per_message_deflate=settings.ws_per_message_deflate
     )
\ No newline at end of file
@@ -107,7 +107,9 @@ export default function TasksClient({ initialTasks, initialStats }: TasksClientP
     setError(null);
     
     startTransition(async () => {
-      const result = await updateTaskAction(id, { title, description });
+      // 帶入編輯時的版本，期間被他人修改時後端回傳 409
+      const version = tasks.find(task => task.id === id)?.version;
+      const result = await updateTaskAction(id, { title, description, version });
       
       if (result.success) {
         await refreshData();
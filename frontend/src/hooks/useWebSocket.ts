@@ -10,6 +10,7 @@ interface UseWebSocketProps {
   taskId: number;
   onNewComment: (comment: Comment) => void;
   onUserJoined?: (userId: number, message: string) => void;
+  onUserLeft?: (userId: number, message: string) => void;
   onUserTyping?: (userId: number, userEmail: string, isTyping: boolean) => void;
   onError?: (error: string) => void;
 }
@@ -24,6 +25,7 @@ export const useWebSocket = ({
   taskId,
   onNewComment,
   onUserJoined,
+  onUserLeft,
   onUserTyping,
   onError
 }: UseWebSocketProps) => {
@@ -32,6 +34,7 @@ export const useWebSocket = ({
   const [connectionStatus, setConnectionStatus] = useState<'connecting' | 'connected' | 'disconnected' | 'error' | 'reconnecting'>('disconnected');
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null);
   const reconnectAttemptsRef = useRef(0);
+  const serverRetryAfterRef = useRef<number | null>(null);
 
   const connect = useCallback(async () => {
     // 防止重複連線
@@ -80,6 +83,21 @@ export const useWebSocket = ({
           const message: WebSocketMessage = JSON.parse(event.data);
           
           switch (message.type) {
+            case 'ping':
+              // 回應伺服器心跳，避免被視為閒置連線而關閉
+              ws.current?.send(JSON.stringify({ type: 'pong' }));
+              break;
+
+            case 'pong':
+              break;
+
+            case 'reconnect':
+              // 伺服器即將關閉，依照建議的隨機退避時間重連
+              if (message.retry_after_ms !== undefined) {
+                serverRetryAfterRef.current = message.retry_after_ms;
+              }
+              break;
+
             case 'new_comment':
               if (message.comment) {
                 onNewComment(message.comment);
@@ -92,12 +110,22 @@ export const useWebSocket = ({
               }
               break;
               
+            case 'user_left':
+              if (message.user_id && message.message) {
+                onUserLeft?.(message.user_id, message.message);
+              }
+              break;
+
             case 'user_typing':
               if (message.user_id && message.user_email !== undefined && message.is_typing !== undefined) {
                 onUserTyping?.(message.user_id, message.user_email, message.is_typing);
               }
               break;
               
+            case 'task_deleted':
+              onError?.('任務已被刪除');
+              break;
+
             case 'error':
               onError?.(message.message || '未知錯誤');
               break;
@@ -118,7 +146,9 @@ export const useWebSocket = ({
         // 如果不是正常關閉，嘗試自動重連
         if (event.code !== 1000 && reconnectAttemptsRef.current < 5) {
           setConnectionStatus('reconnecting');
-          const delay = Math.min(1000 * Math.pow(2, reconnectAttemptsRef.current), 30000); // 指數退避，最多30秒
+          // 優先使用伺服器建議的退避時間，否則指數退避，最多30秒
+          const delay = serverRetryAfterRef.current ?? Math.min(1000 * Math.pow(2, reconnectAttemptsRef.current), 30000);
+          serverRetryAfterRef.current = null;
           
           reconnectAttemptsRef.current++;
           reconnectTimeoutRef.current = setTimeout(() => {
@@ -140,7 +170,7 @@ export const useWebSocket = ({
       setConnectionStatus('error');
       onError?.('建立WebSocket連線失敗');
     }
-  }, [taskId, onNewComment, onUserJoined, onUserTyping, onError]);
+  }, [taskId, onNewComment, onUserJoined, onUserLeft, onUserTyping, onError]);
 
   const disconnect = useCallback(() => {
     if (reconnectTimeoutRef.current) {
@@ -127,7 +127,7 @@ export async function createTaskAction(title: string, description?: string) {
 
 export async function updateTaskAction(
   id: number, 
-  updates: { title?: string; description?: string; status?: TaskStatus }
+  updates: { title?: string; description?: string; status?: TaskStatus; version?: number }
 ) {
   try {
     // 使用統一的安全認證
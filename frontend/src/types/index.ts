@@ -13,6 +13,10 @@ export interface Task {
   created_by: number;
   created_at: string;
   updated_at: string;
+  version?: number;
+  comment_count?: number;
+  last_comment_at?: string | null;
+  archived?: boolean;
   creator?: {
     id: number;
     email: string;
@@ -40,10 +44,12 @@ export interface Comment {
 }
 
 export interface WebSocketMessage {
-  type: 'new_comment' | 'user_joined' | 'user_typing' | 'error';
+  type: 'new_comment' | 'user_joined' | 'user_left' | 'user_typing' | 'error' | 'ping' | 'pong' | 'reconnect' | 'task_deleted';
   comment?: Comment;
   user_id?: number;
   user_email?: string;
   is_typing?: boolean;
   message?: string;
+  retry_after_ms?: number;
+  task_id?: number;
 }
\ No newline at end of file